@@ -0,0 +1,72 @@
+import altair as alt
+import numpy as np
+import pandas as pd
+
+COUNT_COLUMNS = [
+    "tasks_total",
+    "tasks_done",
+    "tasks_timed_done",
+    "tasks_done_on_time",
+    "questions_total",
+    "questions_answered",
+    "answer_secs_total",
+]
+
+
+def metrics_frame(rows: list[dict]) -> pd.DataFrame:
+    df = pd.DataFrame(
+        rows, columns=["care_plan_id", "patient_name", "date"] + COUNT_COLUMNS
+    )
+    df["date"] = pd.to_datetime(df["date"])
+    df[COUNT_COLUMNS] = df[COUNT_COLUMNS].fillna(0).astype("float64")
+    return df
+
+
+def assignments_frame(rows: list[dict]) -> pd.DataFrame:
+    return pd.DataFrame(
+        [(r["care_plan_id"], r["name"]) for r in rows],
+        columns=["care_plan_id", "caregiver"],
+    )
+
+
+def ratio(num: pd.Series, den: pd.Series) -> np.ndarray:
+    num = num.to_numpy(dtype="float64")
+    den = den.to_numpy(dtype="float64")
+    return np.divide(num, den, out=np.full_like(num, np.nan), where=den > 0)
+
+
+def summarize(df: pd.DataFrame, by: list[str]) -> pd.DataFrame:
+    s = df.groupby(by)[COUNT_COLUMNS].sum()
+    s["plans"] = df.groupby(by).size()
+    s["completion_rate"] = ratio(s["tasks_done"], s["tasks_total"])
+    s["on_time_rate"] = ratio(s["tasks_done_on_time"], s["tasks_timed_done"])
+    s["answer_rate"] = ratio(s["questions_answered"], s["questions_total"])
+    s["avg_answer_hours"] = (
+        ratio(s["answer_secs_total"], s["questions_answered"]) / 3600
+    )
+    return s.reset_index()
+
+
+def by_patient(metrics: pd.DataFrame) -> pd.DataFrame:
+    return summarize(metrics, ["patient_name"])
+
+
+def by_caregiver(metrics: pd.DataFrame, assignments: pd.DataFrame) -> pd.DataFrame:
+    # a plan's metrics count towards every caregiver assigned to it
+    return summarize(assignments.merge(metrics, on="care_plan_id"), ["caregiver"])
+
+
+def daily_completion_chart(metrics: pd.DataFrame) -> alt.Chart:
+    daily = summarize(metrics, ["date", "patient_name"])
+    return (
+        alt.Chart(daily)
+        .mark_line(point=True)
+        .encode(
+            x=alt.X("date:T", title="Date"),
+            y=alt.Y(
+                "completion_rate:Q", title="Tasks done", axis=alt.Axis(format="%")
+            ),
+            color=alt.Color("patient_name:N", title="Patient"),
+            tooltip=["date:T", "patient_name:N", "tasks_done:Q", "tasks_total:Q"],
+        )
+    )
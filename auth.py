@@ -0,0 +1,58 @@
+from dataclasses import dataclass, field
+from functools import cache
+import jwt
+
+ASYMMETRIC_ALGORITHMS = ["RS256", "ES256", "EdDSA"]
+JWKS_LIFESPAN_SECS = 600
+
+
+@dataclass(slots=True)
+class TokenUser:
+    """The parts of a supabase user the app reads, taken from verified claims."""
+
+    id: str
+    email: str
+    user_metadata: dict = field(default_factory=dict)
+
+    @staticmethod
+    def from_claims(claims: dict):
+        return TokenUser(
+            claims["sub"], claims.get("email"), claims.get("user_metadata", {})
+        )
+
+
+@cache
+def jwks_client(supabase_url: str) -> jwt.PyJWKClient:
+    # keys are cached for JWKS_LIFESPAN_SECS; a token signed with an unknown
+    # kid makes PyJWKClient refetch the set, which picks up rotated keys
+    return jwt.PyJWKClient(
+        f"{supabase_url.rstrip('/')}/auth/v1/.well-known/jwks.json",
+        cache_keys=True,
+        lifespan=JWKS_LIFESPAN_SECS,
+    )
+
+
+def verify_access_token(
+    token: str, supabase_url: str, jwt_secret: str | None = None
+) -> dict:
+    """Verify a supabase access token locally and return its claims.
+
+    Projects still on the legacy shared secret sign with HS256 and need
+    jwt_secret; asymmetric keys are looked up in the project's JWKS.
+    Raises jwt.InvalidTokenError if the token does not verify.
+    """
+    alg = jwt.get_unverified_header(token).get("alg")
+    if alg == "HS256":
+        if not jwt_secret:
+            raise jwt.InvalidTokenError("HS256 token but no jwt secret configured")
+        key = jwt_secret
+    elif alg in ASYMMETRIC_ALGORITHMS:
+        try:
+            key = jwks_client(supabase_url).get_signing_key_from_jwt(token).key
+        except jwt.PyJWKClientError as e:
+            # unknown kid, forged header or the JWKS endpoint unreachable:
+            # either way the token can't be verified
+            raise jwt.InvalidTokenError(f"no signing key for token: {e}") from e
+    else:
+        raise jwt.InvalidAlgorithmError(f"unsupported algorithm {alg}")
+    return jwt.decode(token, key, algorithms=[alg], audience="authenticated")
@@ -0,0 +1,63 @@
+"""Deserialize time and memory of a care plan payload.
+
+    python bench/codec.py [num_tasks]
+"""
+
+import os
+import sys
+import timeit
+import tracemalloc
+from datetime import date, datetime, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from store import CarePlan, Caregiver, Question, Task
+
+
+def payload(num_tasks: int) -> dict:
+    now = datetime.now()
+    return {
+        "id": "bench",
+        "guardian_id": "bench",
+        "date": date.today().isoformat(),
+        "patient_name": "bench",
+        "created_at": now.isoformat(),
+        "tasks": [
+            Task(
+                f"task {i}",
+                time(hour=i % 24, minute=30 * (i % 2)),
+                time(hour=i % 24, minute=59),
+                i % 3 == 0,
+                now,
+            ).serialize_to_db()
+            for i in range(num_tasks)
+        ],
+        "questions": [
+            Question(f"question {i}", f"answer {i}", now).serialize_to_db()
+            for i in range(num_tasks // 10)
+        ],
+    }
+
+
+def main():
+    num_tasks = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    cp = payload(num_tasks)
+    caregivers: list[Caregiver] = []
+
+    runs = 20
+    secs = timeit.timeit(
+        lambda: CarePlan.deserialize_from_db(cp, caregivers), number=runs
+    )
+
+    tracemalloc.start()
+    plan = CarePlan.deserialize_from_db(cp, caregivers)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f"tasks:       {len(plan.tasks)}")
+    print(f"deserialize: {secs / runs * 1000:.2f} ms")
+    print(f"memory:      {size / 1024:.1f} KiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""Time and accuracy of merging audio extracted tasks into a care plan.
+
+    python bench/dedup.py [num_items ...]
+
+Each plan has num_items tasks; a batch of num_items / 2 new tasks, half of
+them reworded duplicates of existing ones, is merged with the MinHash index
+of dedup.py and with an all pairs Jaccard comparison for reference. found
+can exceed dups, random instructions share words and some are near
+duplicates of each other. The instructions draw on a few dozen words, so
+the index's candidates per lookup grow with the plan: its time grows
+faster than num_items, though slower than all pairs.
+"""
+
+import os
+import random
+import sys
+import timeit
+from datetime import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from dedup import (
+    SIMILARITY_THRESHOLD,
+    TIME_WINDOW_MINS,
+    jaccard,
+    merge_tasks,
+    normalize,
+    times_match,
+)
+from store import Task
+
+VERBS = "give check help bring measure remind clean prepare change walk".split()
+OBJECTS = (
+    "medication pills insulin breakfast lunch dinner water blood pressure "
+    "temperature bandage bedsheets wheelchair glasses hearing aid walker "
+    "oxygen tank compression socks teeth shoes".split()
+)
+PLACES = "kitchen bedroom bathroom garden living room porch hallway".split()
+
+
+def instruction(rng: random.Random) -> str:
+    return (
+        f"{rng.choice(VERBS)} the {rng.choice(OBJECTS)} {rng.choice(OBJECTS)} "
+        f"in the {rng.choice(PLACES)} {rng.choice(PLACES)}"
+    )
+
+
+def reword(rng: random.Random, text: str) -> str:
+    words = text.split()
+    if rng.random() < 0.5:
+        words.insert(0, "please")
+    if rng.random() < 0.5:
+        words[-1] += "s"
+    return " ".join(words).capitalize() + rng.choice([".", "!", ""])
+
+
+def shifted(rng: random.Random, t: time) -> time:
+    minutes = min(max(t.hour * 60 + t.minute + rng.randint(-15, 15), 0), 23 * 60)
+    return time(hour=minutes // 60, minute=minutes % 60)
+
+
+def plan(num_items: int, seed: int = 0) -> tuple[list[Task], list[Task], int]:
+    rng = random.Random(seed)
+    existing = [
+        Task(instruction(rng), time(hour=rng.randint(6, 21), minute=30 * (i % 2)))
+        for i in range(num_items)
+    ]
+    dups = [
+        Task(reword(rng, t.content), shifted(rng, t.start_time))
+        for t in rng.sample(existing, num_items // 4)
+    ]
+    new = [
+        Task(instruction(rng), time(hour=rng.randint(6, 21)))
+        for _ in range(num_items // 4)
+    ]
+    batch = dups + new
+    rng.shuffle(batch)
+    return existing, batch, len(dups)
+
+
+def merge_all_pairs(existing: list[Task], new: list[Task]) -> tuple[list[Task], int]:
+    merged = list(existing)
+    tokens = [normalize(t.content) for t in merged]
+    dropped = 0
+    for t in new:
+        nt = normalize(t.content)
+        if any(
+            jaccard(nt, other) >= SIMILARITY_THRESHOLD
+            and times_match(t.start_time, m.start_time, TIME_WINDOW_MINS)
+            for other, m in zip(tokens, merged)
+        ):
+            dropped += 1
+        else:
+            merged.append(t)
+            tokens.append(nt)
+    return merged, dropped
+
+
+def main():
+    sizes = [int(n) for n in sys.argv[1:]] or [100, 300, 1000]
+    print(
+        f"{'items':>8}{'minhash ms':>12}{'pairs ms':>12}"
+        f"{'dups':>8}{'found':>8}{'pairs found':>13}"
+    )
+    for n in sizes:
+        existing, batch, dups = plan(n)
+        runs = 5
+        secs = timeit.timeit(lambda: merge_tasks(existing, batch), number=runs)
+        pair_secs = timeit.timeit(
+            lambda: merge_all_pairs(existing, batch), number=runs
+        )
+        _, dropped = merge_tasks(existing, batch)
+        _, pair_dropped = merge_all_pairs(existing, batch)
+        print(
+            f"{n:>8}{secs / runs * 1000:>12.2f}{pair_secs / runs * 1000:>12.2f}"
+            f"{dups:>8}{dropped:>8}{pair_dropped:>13}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""Import time of the app, broken down by top-level package.
+
+    python bench/importtime.py [module] [--top N] [--runs N]
+
+Runs `python -X importtime -c "import <module>"` in a fresh interpreter
+(main by default) and sums the self time of every imported module per
+top-level package, which is the cold-start cost paid before the first page
+renders. Streamlit keeps modules in sys.modules between reruns, so the
+per-rerun cost of the same imports is measured by re-executing the import
+statements in an interpreter that already has them loaded.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+RERUN_SCRIPT = """
+import ast, time, {module}
+src = open({module}.__file__).read()
+imports = [
+    n for n in ast.parse(src).body if isinstance(n, (ast.Import, ast.ImportFrom))
+]
+code = compile(ast.Module(imports, []), {module}.__file__, "exec")
+n = 1000
+t = time.perf_counter()
+for _ in range(n):
+    exec(code, {{}})
+print((time.perf_counter() - t) / n * 1e6)
+"""
+
+
+def importtime(module: str) -> list[tuple[str, int, int]]:
+    """(module, self us, cumulative us) of every module imported."""
+    out = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+    )
+    if out.returncode:
+        sys.exit(out.stderr.strip().splitlines()[-1])
+    rows = []
+    for line in out.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        rows.append((name.strip(), int(self_us), int(cumulative_us)))
+    return rows
+
+
+def by_package(rows: list[tuple[str, int, int]]) -> dict[str, tuple[int, int]]:
+    packages = defaultdict(lambda: [0, 0])
+    for name, self_us, _ in rows:
+        p = packages[name.split(".")[0]]
+        p[0] += self_us
+        p[1] += 1
+    return {k: tuple(v) for k, v in packages.items()}
+
+
+def rerun_us(module: str) -> float:
+    out = subprocess.run(
+        [sys.executable, "-c", RERUN_SCRIPT.format(module=module)],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return float(out.stdout)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("module", nargs="?", default="main")
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    # the fastest run has the least noise from the rest of the machine
+    runs = [importtime(args.module) for _ in range(args.runs)]
+    rows = min(runs, key=lambda r: sum(self_us for _, self_us, _ in r))
+    packages = by_package(rows)
+    total = sum(self_us for self_us, _ in packages.values())
+
+    print(f"{'package':<32}{'ms':>10}{'%':>8}{'modules':>10}")
+    for name, (self_us, n) in sorted(
+        packages.items(), key=lambda p: p[1][0], reverse=True
+    )[: args.top]:
+        print(f"{name:<32}{self_us / 1000:>10.1f}{100 * self_us / total:>8.1f}{n:>10}")
+    print(f"{'total':<32}{total / 1000:>10.1f}{'':>8}{len(rows):>10}")
+    print(f"rerun: {rerun_us(args.module):.1f} us to re-execute the imports")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,526 @@
+"""Load test N concurrent app sessions in one server process.
+
+    supabase start    # local stack, `supabase status` prints the keys
+    SUPABASE_URL=http://127.0.0.1:54321 SUPABASE_KEY=<service role key> \
+        python bench/loadtest.py --sessions 1,5,10,20 --duration 60
+
+Every simulated session is a streamlit AppTest running the app's pages, the
+same way the server runs one script thread per browser tab. Half of the
+sessions are guardians and half caregivers, seeded into the local Supabase
+with a care plan each. OpenAI is replaced by a stub server bundled here
+(OPENAI_BASE_URL) that also streams, so audio costs a fixed --openai-latency
+and no tokens. Recordings are archived to S3 when S3_BUCKET (and
+S3_ENDPOINT_URL for a local MinIO) are set, without them the uploads fail
+and the recordings are saved without a key.
+
+A session logs in through the login form, opens its care plans page and
+then reruns every --tick seconds, which is what the 5 second fragments cost
+(AppTest can't run a fragment on its own, so a tick reruns the page). Between
+ticks, at --actions-per-min, guardians edit a task's time or record
+instructions and caregivers tick off a task or answer questions by audio.
+AppTest can't operate data editors or audio inputs, so an action sets the
+value the browser would send and calls the widget's on_change callback at
+the start of a rerun, the way streamlit runs callbacks: edits go through the
+write-behind buffer, audio through archiving and the streamed transcripts,
+and the page is rendered after. For each N it reports throughput, how late
+ticks start (fragment lag), CPU used and resident memory.
+"""
+
+import argparse
+import io
+import json
+import os
+import random
+import resource
+import sys
+import threading
+import time
+import wave
+from dataclasses import dataclass, field
+from datetime import date, time as dt_time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from gotrue.errors import AuthApiError
+from streamlit.testing.v1 import AppTest
+
+from store import DBClient, CarePlan, Question, Task
+
+PASSWORD = "loadtest-password"
+APP_TIMEOUT_SECS = 60
+
+TRANSCRIPT = "yes, everything went fine today"
+# canned tool call arguments of the stub, by function name
+TOOL_ARGUMENTS = {
+    "GetTasksAndQuestions": {
+        "tasks": [
+            {
+                "start_time": {"hour": 9, "minute": 0},
+                "end_time": None,
+                "content": "give morning medication",
+            }
+        ],
+        "questions": ["did they sleep well?"],
+    },
+    "AnswerQuestions": {"answers": [{"question_number": 1, "answer": TRANSCRIPT}]},
+}
+STREAM_CHUNK_CHARS = 16
+
+
+class StubOpenAIHandler(BaseHTTPRequestHandler):
+    """Answers chat completions like OpenAI does, after a fixed latency.
+    Streamed requests get the content or tool call arguments in chunks."""
+
+    latency = 0.5
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        time.sleep(self.latency)
+        tools = body.get("tools")
+        if body.get("stream"):
+            self.stream(body)
+            return
+        message = {"role": "assistant", "content": None}
+        if tools:
+            name = tools[0]["function"]["name"]
+            message["tool_calls"] = [
+                {
+                    "id": "call_loadtest",
+                    "type": "function",
+                    "function": {
+                        "name": name,
+                        "arguments": json.dumps(TOOL_ARGUMENTS.get(name, {})),
+                    },
+                }
+            ]
+        else:
+            message["content"] = TRANSCRIPT
+        data = json.dumps(
+            {
+                "id": "chatcmpl-loadtest",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body.get("model", "stub"),
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": message,
+                        "finish_reason": "tool_calls" if tools else "stop",
+                    }
+                ],
+                "usage": {
+                    "prompt_tokens": 0,
+                    "completion_tokens": 0,
+                    "total_tokens": 0,
+                },
+            }
+        ).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def stream(self, body: dict):
+        tools = body.get("tools")
+        if tools:
+            name = tools[0]["function"]["name"]
+            arguments = json.dumps(TOOL_ARGUMENTS.get(name, {}))
+            deltas = [
+                {
+                    "role": "assistant",
+                    "content": None,
+                    "tool_calls": [
+                        {
+                            "index": 0,
+                            "id": "call_loadtest",
+                            "type": "function",
+                            "function": {"name": name, "arguments": ""},
+                        }
+                    ],
+                }
+            ]
+            deltas.extend(
+                {"tool_calls": [{"index": 0, "function": {"arguments": piece}}]}
+                for piece in chunked(arguments)
+            )
+        else:
+            deltas = [{"role": "assistant", "content": ""}]
+            deltas.extend({"content": piece} for piece in chunked(TRANSCRIPT))
+        # HTTP/1.0, the end of the stream is the end of the connection
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        last = len(deltas)
+        for i, delta in enumerate([*deltas, {}]):
+            chunk = {
+                "id": "chatcmpl-loadtest",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": body.get("model", "stub"),
+                "choices": [
+                    {
+                        "index": 0,
+                        "delta": delta,
+                        "finish_reason": (
+                            ("tool_calls" if tools else "stop") if i == last else None
+                        ),
+                    }
+                ],
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+        self.wfile.write(b"data: [DONE]\n\n")
+
+    def log_message(self, format, *args):
+        pass
+
+
+def chunked(text: str) -> list[str]:
+    return [
+        text[i : i + STREAM_CHUNK_CHARS]
+        for i in range(0, len(text), STREAM_CHUNK_CHARS)
+    ]
+
+
+def start_stub_openai(latency: float) -> ThreadingHTTPServer:
+    StubOpenAIHandler.latency = latency
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubOpenAIHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{server.server_port}/v1"
+    os.environ.setdefault("OPENAI_API_KEY", "loadtest")
+    return server
+
+
+def silent_wav(secs: float = 1.0, rate: int = 16000) -> io.BytesIO:
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes(b"\0\0" * int(secs * rate))
+    return buf
+
+
+@dataclass(slots=True)
+class Account:
+    email: str
+    page: str
+
+
+def ensure_user(db: DBClient, email: str, role: str, first_name: str) -> str:
+    try:
+        return db.client.auth.admin.create_user(
+            {
+                "email": email,
+                "password": PASSWORD,
+                "email_confirm": True,
+                "user_metadata": {
+                    "role": role,
+                    "first_name": first_name,
+                    "last_name": "Loadtest",
+                },
+            }
+        ).user.id
+    except AuthApiError:
+        # seeded by an earlier run
+        return db.get_users([email])[email].id
+
+
+def seed(db: DBClient, households: int) -> list[Account]:
+    """One guardian, caregiver and care plan for today per household."""
+    accounts = []
+    for i in range(households):
+        guardian_email = f"loadtest-guardian-{i}@example.com"
+        caregiver_email = f"loadtest-caregiver-{i}@example.com"
+        guardian_id = ensure_user(db, guardian_email, "GUARDIAN", f"Guardian{i}")
+        caregiver_id = ensure_user(db, caregiver_email, "CAREGIVER", f"Caregiver{i}")
+        if not db.get_care_plans(
+            guardian_id=guardian_id, dt=date.today(), with_notes=False
+        ):
+            cp = db.create_care_plan(
+                guardian_id,
+                date.today(),
+                f"patient {i}",
+                [
+                    Task(f"task {h}", dt_time(hour=h), dt_time(hour=h, minute=30))
+                    for h in range(8, 20)
+                ],
+                [Question(f"question {q}", "") for q in range(5)],
+            )
+            name = f"Caregiver{i} Loadtest"
+            db.create_guardian_caregivers(
+                guardian_id,
+                [
+                    {
+                        "caregiver_id": caregiver_id,
+                        "caregiver_email": caregiver_email,
+                        "caregiver_name": name,
+                    }
+                ],
+            )
+            db.create_caregivers_in_care_plan(cp.id, [(caregiver_id, name)])
+            db.accept_caregiver_invitations(caregiver_id)
+        accounts.append(Account(guardian_email, "care_plans"))
+        accounts.append(Account(caregiver_email, "caregiver_care_plans"))
+    return accounts
+
+
+def session_script():
+    import streamlit as st
+    import loadtest
+    import main
+
+    # main.main() for a signed in user, except for its page navigation and
+    # the session cookie, which AppTest can't do
+    main.init_connection()
+    if not st.session_state.get("user"):
+        main.register_login()
+        return
+    action = st.session_state.pop("loadtest_action", None)
+    if action:
+        loadtest.run_action(*action)
+    main.keep_session_fresh()
+    main.render_reminders()
+    main.refresh_care_plan()
+    getattr(main, st.session_state.loadtest_page)()
+
+
+def run_action(callback: str, key: str, value, *args):
+    """In the session's script thread, what streamlit does when a widget
+    changed: the widget's key holds the value the browser sent while its
+    on_change callback runs. It is dropped after, since the widget is then
+    rendered with a value AppTest can't give it."""
+    import streamlit as st
+    import main
+    from streamlit.proto.Common_pb2 import FileURLs
+    from streamlit.runtime.uploaded_file_manager import UploadedFile, UploadedFileRec
+
+    if isinstance(value, bytes):
+        value = UploadedFile(
+            UploadedFileRec(key, f"{key}.wav", "audio/wav", value), FileURLs()
+        )
+    st.session_state[key] = value
+    try:
+        getattr(main, callback)(*args)
+    finally:
+        del st.session_state[key]
+
+
+@dataclass
+class Stats:
+    login_secs: list[float] = field(default_factory=list)
+    tick_secs: list[float] = field(default_factory=list)
+    lag_secs: list[float] = field(default_factory=list)
+    action_secs: list[float] = field(default_factory=list)
+    errors: list[str] = field(default_factory=list)
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def add(self, name: str, value):
+        with self.lock:
+            getattr(self, name).append(value)
+
+
+class Session:
+    def __init__(self, account: Account, args, stats: Stats):
+        self.account = account
+        self.args = args
+        self.stats = stats
+        self.at = AppTest.from_function(
+            session_script, default_timeout=APP_TIMEOUT_SECS
+        )
+        self.at.secrets["SUPABASE_URL"] = os.environ["SUPABASE_URL"]
+        self.at.secrets["SUPABASE_KEY"] = os.environ["SUPABASE_KEY"]
+        self.at.secrets["REDIRECT_URL"] = "http://localhost:8501"
+        if args.shared_cache:
+            self.at.secrets["SHARED_CACHE_PATH"] = args.shared_cache
+        self.at.session_state["loadtest_page"] = account.page
+
+    def run(self, stop: threading.Event):
+        try:
+            self.login()
+            interval = self.args.tick
+            action_p = self.args.actions_per_min * interval / 60
+            next_tick = time.perf_counter()
+            while not stop.is_set():
+                wait = next_tick - time.perf_counter()
+                if wait > 0 and stop.wait(wait):
+                    break
+                start = time.perf_counter()
+                self.stats.add("lag_secs", max(0.0, start - next_tick))
+                self.rerun()
+                self.stats.add("tick_secs", time.perf_counter() - start)
+                if random.random() < action_p:
+                    start = time.perf_counter()
+                    self.action()
+                    self.stats.add("action_secs", time.perf_counter() - start)
+                next_tick += interval
+        except Exception as e:
+            self.stats.add("errors", f"{self.account.email}: {e!r}")
+
+    def rerun(self):
+        self.at.run()
+        if self.at.exception:
+            raise RuntimeError(self.at.exception[0].message)
+
+    def login(self):
+        start = time.perf_counter()
+        self.rerun()
+        self.at.text_input(key="login_email").input(self.account.email)
+        self.at.text_input(key="login_password").input(PASSWORD)
+        next(b for b in self.at.button if b.label == "Submit").click()
+        self.rerun()
+        if "user" not in self.at.session_state:
+            raise RuntimeError("login failed")
+        # first render of the care plans page
+        self.rerun()
+        self.stats.add("login_secs", time.perf_counter() - start)
+
+    def action(self):
+        state = self.at.session_state
+        cp: CarePlan = state["cur_care_plan"] if "cur_care_plan" in state else None
+        if not cp:
+            return
+        action = (
+            guardian_action(cp)
+            if self.account.page == "care_plans"
+            else caregiver_action(cp)
+        )
+        if not action:
+            return
+        self.at.session_state["loadtest_action"] = action
+        self.rerun()
+
+
+def task_edit(i: int, edit: dict) -> tuple:
+    # the data editor's value: its edits since the plan was rendered
+    edits = {"edited_rows": {i: edit}, "added_rows": [], "deleted_rows": []}
+    return ("task_list_changed", "task_list_changed", edits)
+
+
+def guardian_action(cp: CarePlan) -> tuple | None:
+    if random.random() < 0.25:
+        return ("audio_input_cb", "audio", silent_wav().getvalue())
+    if not cp.tasks:
+        return None
+    hour = random.randint(8, 19)
+    minute = random.choice([0, 30])
+    return task_edit(
+        random.randrange(len(cp.tasks)), {"start_time": f"{hour:02d}:{minute:02d}:00"}
+    )
+
+
+def caregiver_action(cp: CarePlan) -> tuple | None:
+    unanswered = [i for i, q in enumerate(cp.questions) if not q.answer]
+    wav = silent_wav().getvalue()
+    if len(unanswered) > 1 and random.random() < 0.5:
+        return ("audio_answers_cb", "answer_all", wav)
+    if unanswered:
+        i = random.choice(unanswered)
+        return ("audio_answer_cb", f"answer_{i}", wav, i)
+    if not cp.tasks:
+        return None
+    i = random.randrange(len(cp.tasks))
+    return task_edit(i, {"status": not cp.tasks[i].status})
+
+
+def pct(xs: list[float], p: float) -> float:
+    if not xs:
+        return float("nan")
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(p / 100 * len(xs)))]
+
+
+def rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except OSError:
+        # no procfs, fall back to the peak
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def run_level(accounts: list[Account], n: int, args) -> dict:
+    stats = Stats()
+    sessions = [Session(accounts[i % len(accounts)], args, stats) for i in range(n)]
+    stop = threading.Event()
+    threads = [threading.Thread(target=s.run, args=[stop]) for s in sessions]
+    rss_before = rss_bytes()
+    cpu_before = time.process_time()
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+        time.sleep(args.ramp / max(n, 1))
+    stop.wait(args.duration)
+    stop.set()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - start
+    cpu = time.process_time() - cpu_before
+    return {
+        "sessions": n,
+        "ops_per_sec": (len(stats.tick_secs) + len(stats.action_secs)) / wall,
+        "login_p50_ms": 1000 * pct(stats.login_secs, 50),
+        "tick_p50_ms": 1000 * pct(stats.tick_secs, 50),
+        "tick_p95_ms": 1000 * pct(stats.tick_secs, 95),
+        "lag_p95_ms": 1000 * pct(stats.lag_secs, 95),
+        "lag_max_ms": 1000 * max(stats.lag_secs, default=0),
+        "action_p50_ms": 1000 * pct(stats.action_secs, 50),
+        "cpu_pct": 100 * cpu / wall,
+        "rss_mib": rss_bytes() / 2**20,
+        "rss_delta_mib": (rss_bytes() - rss_before) / 2**20,
+        "errors": stats.errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--sessions",
+        type=lambda s: [int(n) for n in s.split(",")],
+        default=[1, 5, 10, 20],
+        help="comma separated session counts to step through",
+    )
+    parser.add_argument("--duration", type=float, default=60, help="secs per level")
+    parser.add_argument("--ramp", type=float, default=5, help="secs to start all")
+    parser.add_argument("--tick", type=float, default=5, help="fragment interval")
+    parser.add_argument("--actions-per-min", type=float, default=2)
+    parser.add_argument("--openai-latency", type=float, default=0.5)
+    parser.add_argument("--shared-cache", help="SHARED_CACHE_PATH for the sessions")
+    parser.add_argument("--json", action="store_true", help="print results as json")
+    args = parser.parse_args()
+
+    start_stub_openai(args.openai_latency)
+    db = DBClient(os.environ["SUPABASE_URL"], os.environ["SUPABASE_KEY"])
+    accounts = seed(db, (max(args.sessions) + 1) // 2)
+
+    columns = [
+        "sessions",
+        "ops_per_sec",
+        "login_p50_ms",
+        "tick_p50_ms",
+        "tick_p95_ms",
+        "lag_p95_ms",
+        "lag_max_ms",
+        "action_p50_ms",
+        "cpu_pct",
+        "rss_mib",
+    ]
+    if not args.json:
+        print("".join(f"{c:>15}" for c in columns))
+    results = []
+    for n in args.sessions:
+        r = run_level(accounts, n, args)
+        results.append(r)
+        if args.json:
+            continue
+        print("".join(f"{r[c]:>15.1f}" for c in columns))
+        for e in r["errors"]:
+            print(f"  error: {e}", file=sys.stderr)
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
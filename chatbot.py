@@ -3,6 +3,7 @@ import base64
 from openai import OpenAI, pydantic_function_tool
 import json
 from datetime import datetime, date, time
+from typing import Iterator
 from store import Task as CarePlanTask, Question
 from utils import add_time
 
@@ -58,6 +59,19 @@ class GetTasksAndQuestions(BaseModel):
     questions: list[str] = Field(description="questions found")
 
 
+class Answer(BaseModel):
+    question_number: int = Field(description="number of the question answered")
+    answer: str = Field(description="the answer, word for word from the audio")
+
+
+class AnswerQuestions(BaseModel):
+    """answers in the audio input to the numbered questions"""
+
+    answers: list[Answer] = Field(
+        description="answers found, leave out questions that are not answered"
+    )
+
+
 def parse_time(
     time_str: str | None, content_str: str, reference_date: date
 ) -> datetime | None:
@@ -78,47 +92,67 @@ def parse_time(
     return time
 
 
-def generate_tasks_from_audio(audio) -> tuple[list[CarePlanTask], list[Question]]:
-    encoded_string = base64.b64encode(audio.getvalue()).decode("utf-8")
-    system_prompt = """
+TASKS_SYSTEM_PROMPT = """
     You are a helpful assistant. Each user input will be an audio message containing
     some instructions and questions for a health aide. An instruction might have a start time
     and/or an end time. Use the supplied function to parse the instructions and questions in their 
     respective list format. 
     """
-    # The user input may also contain some existing instructions and/or questions.
-    # Make usre the final output does not contain duplicates.
-    completion = OpenAI().chat.completions.create(
+# The user input may also contain some existing instructions and/or questions.
+# Make usre the final output does not contain duplicates.
+
+
+def tasks_messages(audio) -> list[dict]:
+    encoded_string = base64.b64encode(audio.getvalue()).decode("utf-8")
+    return [
+        {
+            "role": "system",
+            "content": TASKS_SYSTEM_PROMPT,
+        },
+        {
+            "role": "user",
+            "content": [
+                {
+                    "type": "input_audio",
+                    "input_audio": {"data": encoded_string, "format": "wav"},
+                },
+            ],
+        },
+    ]
+
+
+def stream_tasks_from_audio(audio) -> Iterator[CarePlanTask | Question]:
+    """The tasks and questions in a recording of instructions, each yielded as
+    soon as the streamed tool call arguments contain all of it."""
+    tasks_done = questions_done = 0
+    with OpenAI().beta.chat.completions.stream(
         model="gpt-4o-audio-preview",
         modalities=["text"],
-        messages=[
-            {
-                "role": "system",
-                "content": system_prompt,
-            },
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "type": "input_audio",
-                        "input_audio": {"data": encoded_string, "format": "wav"},
-                    },
-                ],
-            },
-        ],
+        messages=tasks_messages(audio),
         tools=[pydantic_function_tool(GetTasksAndQuestions)],
-    )
-    arguments = json.loads(
-        completion.choices[0].message.tool_calls[0].function.arguments
-    )
-    tq = GetTasksAndQuestions(**arguments)
-    return (
-        [task.deserialize() for task in tq.tasks],
-        [Question(q, "") for q in tq.questions],
-    )
-
-
-def transcribe_audio(audio, question: str | None = None) -> str:
+    ) as stream:
+        for event in stream:
+            if event.type == "tool_calls.function.arguments.delta":
+                args, final = event.parsed_arguments or {}, False
+            elif event.type == "tool_calls.function.arguments.done":
+                args, final = event.parsed_arguments or {}, True
+            else:
+                continue
+            tasks = args.get("tasks", [])
+            questions = args.get("questions", [])
+            # the last item of a list may still be cut off, unless the list
+            # is followed by the next field or the arguments are complete
+            n = len(tasks) if final or "questions" in args else len(tasks) - 1
+            for t in tasks[tasks_done:n]:
+                yield Task(**t).deserialize()
+            tasks_done = max(tasks_done, n)
+            n = len(questions) if final else len(questions) - 1
+            for q in questions[questions_done:n]:
+                yield Question(q, "")
+            questions_done = max(questions_done, n)
+
+
+def transcribe_messages(audio, question: str | None = None) -> list[dict]:
     system_prompt = "You are a helpful assistant. Transcribe this audio word for word"
     if question:
         system_prompt += ", which is an answer to a question, also given as text."
@@ -137,7 +171,38 @@ def transcribe_audio(audio, question: str | None = None) -> str:
                 "text": f"The attached audio, to be transcribed, is an answer to this question {question}",
             }
         )
+    return [
+        {
+            "role": "system",
+            "content": system_prompt,
+        },
+        {"role": "user", "content": content},
+    ]
+
+
+def stream_transcript(audio, question: str | None = None) -> Iterator[str]:
+    """Word for word transcript of audio, a chunk at a time, for st.write_stream."""
+    for chunk in OpenAI().chat.completions.create(
+        model="gpt-4o-audio-preview",
+        modalities=["text"],
+        messages=transcribe_messages(audio, question),
+        stream=True,
+    ):
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
 
+def answer_questions_from_audio(audio, questions: list[str]) -> dict[int, str]:
+    """Answers in one recording to several questions, by index in questions.
+    Questions the recording doesn't answer are left out."""
+    encoded_string = base64.b64encode(audio.getvalue()).decode("utf-8")
+    system_prompt = """
+    You are a helpful assistant. Each user input will be an audio message in which a
+    health aide answers some of the numbered questions given as text. Use the supplied
+    function to return each answer, transcribed word for word, with the number of the
+    question it answers.
+    """
+    numbered = "\n".join(f"{i + 1}. {q}" for i, q in enumerate(questions))
     completion = OpenAI().chat.completions.create(
         model="gpt-4o-audio-preview",
         modalities=["text"],
@@ -146,7 +211,27 @@ def transcribe_audio(audio, question: str | None = None) -> str:
                 "role": "system",
                 "content": system_prompt,
             },
-            {"role": "user", "content": content},
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "input_audio",
+                        "input_audio": {"data": encoded_string, "format": "wav"},
+                    },
+                    {"type": "text", "text": f"The questions are:\n{numbered}"},
+                ],
+            },
         ],
+        tools=[pydantic_function_tool(AnswerQuestions)],
+        tool_choice="required",
     )
-    return completion.choices[0].message.content
+    tool_calls = completion.choices[0].message.tool_calls
+    if not tool_calls:
+        return {}
+    aq = AnswerQuestions(**json.loads(tool_calls[0].function.arguments))
+    answers = {}
+    for a in aq.answers:
+        i = a.question_number - 1
+        if 0 <= i < len(questions) and a.answer.strip() and i not in answers:
+            answers[i] = a.answer.strip()
+    return answers
@@ -0,0 +1,161 @@
+from datetime import time
+from functools import lru_cache
+from hashlib import blake2b
+from typing import Hashable
+import random
+import re
+from store import Task, Question
+from utils import minutes_of_day
+
+SIMILARITY_THRESHOLD = 0.6
+TIME_WINDOW_MINS = 30
+NUM_BANDS = 20
+BAND_ROWS = 3
+
+STOPWORDS = frozenset(
+    "a an and are as at be by do does for from has have he her his i if in is it "
+    "its me my of on or our please she so that the their them they this to was "
+    "we were will with you your".split()
+)
+_MERSENNE = (1 << 61) - 1
+_rng = random.Random(0)
+# one (a, b) pair per row of every band: h -> (a * h + b) mod p
+_PERMUTATIONS = [
+    (_rng.randrange(1, _MERSENNE), _rng.randrange(_MERSENNE))
+    for _ in range(NUM_BANDS * BAND_ROWS)
+]
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def normalize(text: str) -> frozenset[str]:
+    words = _WORD.findall(text.lower())
+    tokens = [w for w in words if w not in STOPWORDS] or words
+    # crude plural stripping, "pills" and "pill" should match
+    return frozenset(
+        t[:-1] if len(t) > 3 and t.endswith("s") and not t.endswith("ss") else t
+        for t in tokens
+    )
+
+
+@lru_cache(maxsize=65536)
+def _token_signature(token: str) -> tuple[int, ...]:
+    # plans reuse a small vocabulary, so each token is hashed once
+    h = int.from_bytes(blake2b(token.encode(), digest_size=8).digest(), "big")
+    return tuple((a * h + b) % _MERSENNE for a, b in _PERMUTATIONS)
+
+
+def minhash(tokens: frozenset[str]) -> list[int]:
+    if not tokens:
+        return [0] * len(_PERMUTATIONS)
+    return [min(col) for col in zip(*map(_token_signature, tokens))]
+
+
+def jaccard(a: frozenset[str], b: frozenset[str]) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+def times_match(a: time | None, b: time | None, window_mins: int) -> bool:
+    # an instruction re-recorded without its time is the same instruction
+    if a is None or b is None:
+        return True
+    return abs(minutes_of_day(a) - minutes_of_day(b)) <= window_mins
+
+
+class SimilarityIndex:
+    """Near-duplicate lookup of short texts, such as task instructions.
+
+    Texts are normalized to token sets and MinHashed; locality sensitive
+    hashing on bands of the signature finds candidates without comparing
+    every text added, which are confirmed by their exact token Jaccard
+    similarity and, when both have one, start times within window_mins.
+    A lookup costs one comparison per text sharing a band, so it is cheap
+    while texts are mostly unrelated, but when many share words the
+    candidates grow with the index and merging approaches all pairs.
+    """
+
+    def __init__(
+        self,
+        threshold: float = SIMILARITY_THRESHOLD,
+        window_mins: int = TIME_WINDOW_MINS,
+    ):
+        self.threshold = threshold
+        self.window_mins = window_mins
+        self._buckets: dict[tuple, list[Hashable]] = {}
+        self._items: dict[Hashable, tuple[frozenset[str], time | None]] = {}
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def _bands(self, tokens: frozenset[str]) -> list[tuple]:
+        sig = minhash(tokens)
+        return [
+            (band, *sig[band * BAND_ROWS : (band + 1) * BAND_ROWS])
+            for band in range(NUM_BANDS)
+        ]
+
+    def add(self, key: Hashable, text: str, start_time: time | None = None):
+        tokens = normalize(text)
+        self._items[key] = (tokens, start_time)
+        for band in self._bands(tokens):
+            self._buckets.setdefault(band, []).append(key)
+
+    def find(self, text: str, start_time: time | None = None) -> Hashable | None:
+        """Key of the most similar text added, None if there is none close."""
+        tokens = normalize(text)
+        best, best_score = None, self.threshold
+        seen = set()
+        for band in self._bands(tokens):
+            for key in self._buckets.get(band, ()):
+                if key in seen:
+                    continue
+                seen.add(key)
+                other, other_time = self._items[key]
+                score = jaccard(tokens, other)
+                if score >= best_score and times_match(
+                    start_time, other_time, self.window_mins
+                ):
+                    best, best_score = key, score
+        return best
+
+
+def merge_tasks(existing: list[Task], new: list[Task]) -> tuple[list[Task], int]:
+    """existing with the tasks of new that aren't near-duplicates of one
+    already there, and the number of duplicates dropped. A duplicate fills
+    in the times of the task it matches if that had none."""
+    index = SimilarityIndex()
+    for i, t in enumerate(existing):
+        index.add(i, t.content, t.start_time)
+    merged = list(existing)
+    dropped = 0
+    for t in new:
+        i = index.find(t.content, t.start_time)
+        if i is None:
+            index.add(len(merged), t.content, t.start_time)
+            merged.append(t)
+            continue
+        dropped += 1
+        if merged[i].start_time is None and t.start_time is not None:
+            merged[i].start_time = t.start_time
+            merged[i].end_time = t.end_time
+    return merged, dropped
+
+
+def merge_questions(
+    existing: list[Question], new: list[Question]
+) -> tuple[list[Question], int]:
+    """existing with the questions of new that aren't near-duplicates of one
+    already there, and the number of duplicates dropped."""
+    index = SimilarityIndex()
+    for i, q in enumerate(existing):
+        index.add(i, q.question)
+    merged = list(existing)
+    dropped = 0
+    for q in new:
+        if index.find(q.question) is None:
+            index.add(len(merged), q.question)
+            merged.append(q)
+        else:
+            dropped += 1
+    return merged, dropped
@@ -0,0 +1,144 @@
+"""Export care plans as one row per task, question and caregiver note.
+
+    python export.py --guardian-id <id> --start 2024-01-01 --end 2024-12-31 \
+        --format parquet plans.parquet
+
+Plans are read a page at a time and written as they arrive, so memory stays
+bounded by the page size regardless of how much history is exported.
+Reads SUPABASE_URL and SUPABASE_KEY from the environment.
+"""
+
+from datetime import date
+from typing import IO, Iterable, Iterator
+import argparse
+import csv
+import os
+import sys
+from store import DBClient, CarePlan
+
+COLUMNS = [
+    "care_plan_id",
+    "date",
+    "patient_name",
+    "kind",
+    "text",
+    "answer",
+    "start_time",
+    "end_time",
+    "status",
+    "caregiver",
+    "timestamp",
+]
+PARQUET_BATCH_ROWS = 10_000
+
+
+def care_plan_rows(cp: CarePlan) -> Iterator[dict]:
+    base = {
+        "care_plan_id": cp.id,
+        "date": cp.date.isoformat(),
+        "patient_name": cp.patient_name,
+    }
+    for t in cp.tasks:
+        yield {
+            **base,
+            "kind": "task",
+            "text": t.content,
+            "start_time": t.start_time.isoformat() if t.start_time else None,
+            "end_time": t.end_time.isoformat() if t.end_time else None,
+            "status": t.status,
+            "timestamp": t.updated_at.isoformat(),
+        }
+    for q in cp.questions:
+        yield {
+            **base,
+            "kind": "question",
+            "text": q.question,
+            "answer": q.answer,
+            "status": bool(q.answer),
+            "timestamp": q.updated_at.isoformat(),
+        }
+    for n, name in cp.caregiver_notes:
+        yield {
+            **base,
+            "kind": "note",
+            "text": n.note,
+            "caregiver": name,
+            "timestamp": n.created_at.isoformat(),
+        }
+
+
+def export_rows(
+    db_client: DBClient,
+    guardian_id: str | None = None,
+    start: date | None = None,
+    end: date | None = None,
+    page_size: int = 100,
+) -> Iterator[dict]:
+    for page in db_client.iter_care_plans(guardian_id, start, end, page_size):
+        for cp in page:
+            yield from care_plan_rows(cp)
+
+
+def write_csv(rows: Iterable[dict], f: IO[str]) -> int:
+    writer = csv.DictWriter(f, fieldnames=COLUMNS)
+    writer.writeheader()
+    n = 0
+    for r in rows:
+        writer.writerow(r)
+        n += 1
+    return n
+
+
+def write_parquet(
+    rows: Iterable[dict], path: str, batch_rows: int = PARQUET_BATCH_ROWS
+) -> int:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema(
+        [(c, pa.bool_() if c == "status" else pa.string()) for c in COLUMNS]
+    )
+    n = 0
+    with pq.ParquetWriter(path, schema) as writer:
+        batch = []
+        for r in rows:
+            batch.append(r)
+            if len(batch) >= batch_rows:
+                writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+                n += len(batch)
+                batch = []
+        if batch:
+            writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+            n += len(batch)
+    return n
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("output", help="output file, - for stdout (csv only)")
+    parser.add_argument("--guardian-id")
+    parser.add_argument("--start", type=date.fromisoformat)
+    parser.add_argument("--end", type=date.fromisoformat)
+    parser.add_argument("--format", choices=["csv", "parquet"], default="csv")
+    parser.add_argument("--page-size", type=int, default=100)
+    args = parser.parse_args()
+
+    rows = export_rows(
+        DBClient(os.environ["SUPABASE_URL"], os.environ["SUPABASE_KEY"]),
+        args.guardian_id,
+        args.start,
+        args.end,
+        args.page_size,
+    )
+    if args.format == "parquet":
+        n = write_parquet(rows, args.output)
+    elif args.output == "-":
+        n = write_csv(rows, sys.stdout)
+    else:
+        with open(args.output, "w", newline="") as f:
+            n = write_csv(rows, f)
+    print(f"exported {n} rows", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
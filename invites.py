@@ -0,0 +1,218 @@
+from dataclasses import dataclass
+from enum import Enum
+from typing import Callable, Iterable
+import csv
+import io
+import threading
+import time
+from gotrue.errors import AuthApiError
+from store import DBClient, CarePlan
+
+# supabase rate limits OTP emails per project, keep well below it
+INVITES_PER_SEC = 0.5
+MAX_ATTEMPTS = 4
+RETRY_BACKOFF_SECS = 2.0
+
+
+class Invite_Status(Enum):
+    PENDING = "PENDING"
+    SENT = "SENT"
+    ALREADY_IN_PLAN = "ALREADY IN PLAN"
+    FAILED = "FAILED"
+
+
+@dataclass(slots=True)
+class Invite:
+    email: str
+    first_name: str
+    last_name: str
+    status: Invite_Status = Invite_Status.PENDING
+    attempts: int = 0
+    error: str = ""
+    caregiver_id: str | None = None
+
+    @property
+    def name(self) -> str:
+        return f"{self.first_name} {self.last_name}"
+
+
+def parse_invites(rows: Iterable[dict]) -> list[Invite]:
+    invites = {}
+    for r in rows:
+        email = (r.get("email") or "").strip().lower()
+        if email and email not in invites:
+            invites[email] = Invite(
+                email,
+                (r.get("first_name") or "").strip(),
+                (r.get("last_name") or "").strip(),
+            )
+    return list(invites.values())
+
+
+def parse_invites_csv(data: bytes) -> list[Invite]:
+    """CSV with an email, first_name and last_name header."""
+    return parse_invites(csv.DictReader(io.StringIO(data.decode("utf-8-sig"))))
+
+
+class RateLimiter:
+    """Token bucket allowing rate calls per second with bursts of up to burst."""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.burst, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def send_with_retry(invite: Invite, send: Callable[[Invite], None], limiter):
+    while invite.attempts < MAX_ATTEMPTS:
+        limiter.acquire()
+        invite.attempts += 1
+        try:
+            send(invite)
+            invite.status = Invite_Status.SENT
+            invite.error = ""
+            return
+        except AuthApiError as e:
+            invite.error = str(e)
+            # only rate limiting and server errors are worth retrying
+            status = e.status or 0
+            if status != 429 and status < 500:
+                break
+        except Exception as e:
+            # timeouts and dropped connections, retried like server errors
+            invite.error = str(e) or type(e).__name__
+        if invite.attempts < MAX_ATTEMPTS:
+            time.sleep(RETRY_BACKOFF_SECS * 2 ** (invite.attempts - 1))
+    invite.status = Invite_Status.FAILED
+
+
+class InviteBatch:
+    """Invites caregivers to a care plan from a background thread.
+
+    Known caregivers of the guardian are looked up in one query, OTP emails
+    go out through a rate limited, retrying queue and the new caregiver_notes
+    and guardian_caregiver rows are written with one insert each, for the
+    invites sent even if the batch stops early. invites carries the per
+    invite status while the batch runs.
+    """
+
+    def __init__(
+        self,
+        db_client: DBClient,
+        cp: CarePlan,
+        invites: list[Invite],
+        redirect_url: str,
+        rate: float = INVITES_PER_SEC,
+    ):
+        self.db_client = db_client
+        self.cp = cp
+        self.invites = invites
+        self.redirect_url = redirect_url
+        self.limiter = RateLimiter(rate)
+        self.error = ""
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    @property
+    def done(self) -> bool:
+        return not self.thread.is_alive()
+
+    def start(self):
+        self.thread.start()
+
+    def run(self):
+        try:
+            self._run()
+        except Exception as e:
+            self.error = str(e)
+            for invite in self.invites:
+                if invite.status == Invite_Status.PENDING:
+                    invite.status = Invite_Status.FAILED
+                    invite.error = self.error
+
+    def _run(self):
+        known = {
+            cg["caregiver_email"].lower(): cg
+            for cg in self.db_client.get_caregivers_for_guardian(
+                self.cp.guardian_id, caregiver_emails=[i.email for i in self.invites]
+            )
+        }
+        in_plan = {cg.id for cg in self.cp.caregivers}
+        try:
+            for invite in self.invites:
+                cg = known.get(invite.email)
+                if cg:
+                    invite.caregiver_id = cg["caregiver_id"]
+                    if invite.caregiver_id in in_plan:
+                        invite.status = Invite_Status.ALREADY_IN_PLAN
+                        continue
+                elif not invite.first_name or not invite.last_name:
+                    invite.status = Invite_Status.FAILED
+                    invite.error = (
+                        "first and last name are required for new caregivers"
+                    )
+                    continue
+                send_with_retry(invite, self.send, self.limiter)
+        finally:
+            self._save(known)
+
+    def _save(self, known: dict[str, dict]):
+        """Adds the caregivers of the invites sent so far to the plan."""
+        sent = [i for i in self.invites if i.status == Invite_Status.SENT]
+        new = [i for i in sent if not i.caregiver_id]
+        users = self.db_client.get_caregiver_users([i.email for i in new])
+        for invite in new:
+            user = users.get(invite.email)
+            if not user:
+                invite.status = Invite_Status.FAILED
+                invite.error = "caregiver account was not created"
+                continue
+            invite.caregiver_id = user.id
+        self.db_client.create_guardian_caregivers(
+            self.cp.guardian_id,
+            [
+                {
+                    "caregiver_id": i.caregiver_id,
+                    "caregiver_email": i.email,
+                    "caregiver_name": i.name,
+                }
+                for i in new
+                if i.caregiver_id
+            ],
+        )
+        self.db_client.create_caregivers_in_care_plan(
+            self.cp.id,
+            [
+                (i.caregiver_id, known[i.email]["caregiver_name"])
+                if i.email in known
+                else (i.caregiver_id, i.name)
+                for i in sent
+                if i.caregiver_id
+            ],
+        )
+
+    def send(self, invite: Invite):
+        if invite.caregiver_id:
+            self.db_client.sign_in_with_otp(invite.email, self.redirect_url)
+        else:
+            self.db_client.sign_in_with_otp(
+                invite.email,
+                self.redirect_url,
+                invite.first_name,
+                invite.last_name,
+            )
@@ -1,4 +1,5 @@
 import streamlit as st
+import streamlit.components.v1 as components
 from store import (
     DBClient,
     Role,
@@ -6,19 +7,34 @@ from store import (
     CarePlan,
     Question,
     Task,
-    CaregiverNote,
 )
-from datetime import date, datetime, time
-from streamlit_calendar import calendar
-from gotrue.errors import AuthApiError
+from datetime import date, datetime, time, timedelta
+from gotrue.errors import AuthApiError, AuthRetryableError
 from streamlit_url_fragment import get_fragment
-import jwt
-from streamlit_extras.stylable_container import stylable_container
-from chatbot import generate_tasks_from_audio, transcribe_audio
-from utils import add_time, get_diff_time
+from urllib.parse import parse_qs
+import uuid
+from utils import add_time, get_diff_time, archive_audio, archived_key
+from concurrent.futures import Future
+from plan_cache import PlanCache, DEFAULT_BUDGET_BYTES, plan_nbytes
+from schedule import TimeSlotIndex, CaregiverSchedule, task_slot
+from write_behind import WriteBehind, WRITE_DELAY_SECS
+from invites import InviteBatch, INVITES_PER_SEC, parse_invites_csv
+from shared_cache import SharedCache, DEFAULT_TTL_SECS
+from dedup import merge_tasks, merge_questions
+from reminders import (
+    ClaimedNotifier,
+    ReminderEngine,
+    InAppNotifier,
+    Reminder_Kind,
+    WebhookNotifier,
+    REMINDER_LEAD_SECS,
+)
 
 TASKS_PLACEHOLDER = "No tasks yet!"
 QUESTIONS_PLACEHOLDER = "No questions yet!"
+SESSION_COOKIE = "relait_session"
+SESSION_MAX_AGE_SECS = 30 * 24 * 3600
+TOKEN_REFRESH_MARGIN_SECS = 300
 
 calendar_options = {
     "headerToolbar": {
@@ -27,15 +43,213 @@ calendar_options = {
     },
     "slotMinTime": "06:00:00",
     "slotMaxTime": "18:00:00",
-    "initialView": "timeGridDay",
+    "initialView": "timeGridWeek",
 }
 
 
+@st.cache_resource
+def shared_cache() -> SharedCache | None:
+    path = st.secrets.get("SHARED_CACHE_PATH")
+    if not path:
+        return None
+    return SharedCache(path, st.secrets.get("SHARED_CACHE_TTL_SECS", DEFAULT_TTL_SECS))
+
+
+@st.cache_resource
+def reminder_notifier() -> InAppNotifier:
+    return InAppNotifier()
+
+
+@st.cache_resource
+def reminder_engine() -> ReminderEngine | None:
+    if not st.secrets.get("REMINDERS", True):
+        return None
+    notifiers = [reminder_notifier()]
+    # every server process runs an engine, the shared cache lets only one of
+    # them post each reminder, so the webhook needs it
+    if st.secrets.get("REMINDER_WEBHOOK_URL") and shared_cache():
+        notifiers.append(
+            ClaimedNotifier(
+                WebhookNotifier(st.secrets["REMINDER_WEBHOOK_URL"]), shared_cache()
+            )
+        )
+    db_client = DBClient(
+        st.secrets["SUPABASE_URL"], st.secrets["SUPABASE_KEY"], shared_cache()
+    )
+    engine = ReminderEngine(
+        db_client,
+        notifiers,
+        st.secrets.get("REMINDER_LEAD_SECS", REMINDER_LEAD_SECS),
+    )
+    engine.start()
+    return engine
+
+
 def init_connection() -> None:
     if "db_client" not in st.session_state:
         st.session_state["db_client"] = DBClient(
-            st.secrets["SUPABASE_URL"], st.secrets["SUPABASE_KEY"]
+            st.secrets["SUPABASE_URL"], st.secrets["SUPABASE_KEY"], shared_cache()
+        )
+        engine = reminder_engine()
+        if engine:
+            st.session_state.db_client.listeners.append(engine.on_write)
+    if "write_behind" not in st.session_state:
+        st.session_state["write_behind"] = WriteBehind(
+            st.session_state.db_client,
+            st.secrets.get("WRITE_DELAY_SECS", WRITE_DELAY_SECS),
+        )
+    if "plan_cache" not in st.session_state:
+        st.session_state["plan_cache"] = PlanCache(
+            st.secrets.get("SESSION_PLAN_CACHE_BYTES", DEFAULT_BUDGET_BYTES)
+        )
+
+
+def load_care_plan(care_plan_id: str) -> CarePlan | None:
+    cur: CarePlan = st.session_state.get("cur_care_plan")
+    if cur and cur.id == care_plan_id:
+        return cur
+    if cur:
+        # leaving a plan, don't leave its edits waiting in the buffer
+        st.session_state.write_behind.flush(cur.id)
+    # a cached copy may be stale until refresh_care_plan reloads it, edits
+    # made on it before then are rejected by the write-behind version check
+    cp = st.session_state.plan_cache.get(care_plan_id)
+    if not cp:
+        cp = st.session_state.db_client.get_care_plan(care_plan_id)
+    if cur:
+        st.session_state.plan_cache.put(cur)
+    if cp:
+        st.session_state.plan_cache.discard(cp.id)
+    return cp
+
+
+def session_nbytes() -> int:
+    cp: CarePlan = st.session_state.get("cur_care_plan")
+    return st.session_state.plan_cache.nbytes + (plan_nbytes(cp) if cp else 0)
+
+
+def verified_claims(access_token: str) -> dict | None:
+    import jwt
+    from auth import verify_access_token
+
+    claims = st.session_state.setdefault("token_claims", {})
+    cached = claims.get(access_token)
+    # the signature is checked once per token, its expiry on every use
+    if cached and cached["exp"] > datetime.now().timestamp():
+        return cached
+    claims.pop(access_token, None)
+    try:
+        claims[access_token] = verify_access_token(
+            access_token,
+            st.secrets["SUPABASE_URL"],
+            st.secrets.get("SUPABASE_JWT_SECRET"),
         )
+    except jwt.InvalidTokenError as e:
+        st.error(f"Invalid or expired link: {e}")
+        return None
+    return claims[access_token]
+
+
+def persist_session(user_id: str, access_token: str, refresh_token: str, expires_at):
+    st.session_state["auth_session"] = st.session_state.db_client.create_user_session(
+        user_id, access_token, refresh_token, int(expires_at)
+    )
+    # the cookie is written by the next full run, callbacks can't render it
+    st.session_state["session_cookie_pending"] = True
+
+
+def write_session_cookie():
+    if not st.session_state.pop("session_cookie_pending", False):
+        return
+    session_id = st.session_state.auth_session["id"]
+    components.html(
+        f"""<script>
+        window.parent.document.cookie =
+          "{SESSION_COOKIE}={session_id}; path=/; max-age={SESSION_MAX_AGE_SECS}; SameSite=Strict; Secure";
+        </script>""",
+        height=0,
+    )
+
+
+def restore_session():
+    session_id = st.context.cookies.get(SESSION_COOKIE)
+    if not session_id:
+        return
+    try:
+        uuid.UUID(session_id)
+    except ValueError:
+        return
+    session = st.session_state.db_client.get_user_session(session_id)
+    if not session:
+        return
+    st.session_state["auth_session"] = session
+    if session["expires_at"] - datetime.now().timestamp() < TOKEN_REFRESH_MARGIN_SECS:
+        if not refresh_auth_session():
+            return
+    import jwt
+    from auth import TokenUser, verify_access_token
+
+    try:
+        claims = verify_access_token(
+            session["access_token"],
+            st.secrets["SUPABASE_URL"],
+            st.secrets.get("SUPABASE_JWT_SECRET"),
+        )
+    except jwt.InvalidTokenError:
+        return
+    st.session_state["user"] = TokenUser.from_claims(claims)
+
+
+def refresh_auth_session() -> bool:
+    import httpx
+
+    session = st.session_state.auth_session
+    try:
+        refreshed = st.session_state.db_client.refresh_session(
+            session["refresh_token"]
+        ).session
+    except AuthApiError:
+        st.session_state.db_client.delete_user_session(session["id"])
+        del st.session_state["auth_session"]
+        return False
+    except (AuthRetryableError, httpx.HTTPError):
+        # the auth server couldn't be reached: keep the session for the next
+        # try, it's usable until its access token expires
+        return session["expires_at"] > datetime.now().timestamp()
+    session["access_token"] = refreshed.access_token
+    session["refresh_token"] = refreshed.refresh_token
+    session["expires_at"] = int(refreshed.expires_at)
+    st.session_state.db_client.update_user_session(
+        session["id"],
+        session["access_token"],
+        session["refresh_token"],
+        session["expires_at"],
+    )
+    return True
+
+
+@st.fragment(run_every="5s")
+def render_reminders():
+    for r in reminder_notifier().drain(st.session_state.user.id):
+        st.toast(
+            r.message,
+            icon=(
+                ":material/alarm:"
+                if r.kind == Reminder_Kind.DUE
+                else ":material/assignment_late:"
+            ),
+        )
+
+
+@st.fragment(run_every="60s")
+def keep_session_fresh():
+    session = st.session_state.get("auth_session")
+    if (
+        session
+        and session["expires_at"] - datetime.now().timestamp()
+        < TOKEN_REFRESH_MARGIN_SECS
+    ):
+        refresh_auth_session()
 
 
 def login_submit(is_login: bool):
@@ -44,11 +258,19 @@ def login_submit(is_login: bool):
             st.error("Please provide login information")
             return
         try:
-            st.session_state["user"] = st.session_state.db_client.sign_in(
+            auth = st.session_state.db_client.sign_in(
                 st.session_state.login_email, st.session_state.login_password
             )
         except AuthApiError as e:
             st.error(e)
+            return
+        st.session_state["user"] = auth.user
+        persist_session(
+            auth.user.id,
+            auth.session.access_token,
+            auth.session.refresh_token,
+            auth.session.expires_at,
+        )
         return
     try:
         if (
@@ -123,7 +345,6 @@ def question_list_changed():
             st.session_state.question_list_changed["deleted_rows"], reverse=True
         ):
             del cp.questions[r]
-        cp = st.session_state.db_client.update_care_plan(cp.id, questions=cp.questions)
 
     if st.session_state.question_list_changed["edited_rows"]:
         for r, edit in st.session_state.question_list_changed["edited_rows"].items():
@@ -136,7 +357,6 @@ def question_list_changed():
             if "answer" in edit:
                 cp.questions[r].answer = edit["answer"]
             cp.questions[r].updated_at = datetime.now()
-        cp = st.session_state.db_client.update_care_plan(cp.id, questions=cp.questions)
 
     if st.session_state.question_list_changed["added_rows"]:
         added = [
@@ -145,19 +365,41 @@ def question_list_changed():
             if r.get("question")
         ]
         cp.questions.extend(added)
-        cp = st.session_state.db_client.update_care_plan(cp.id, questions=cp.questions)
 
-    st.session_state.cur_care_plan = cp
+    st.session_state.write_behind.schedule(cp, questions=True)
+
+
+def warn_task_conflicts(cp: CarePlan):
+    schedule = CaregiverSchedule(
+        st.session_state.db_client.get_caregiver_assignments(
+            [cg.id for cg in cp.caregivers], cp.date
+        )
+    )
+    for i, t in enumerate(cp.tasks):
+        slot = task_slot(cp.id, cp.patient_name, cp.date, i, t)
+        if not slot:
+            continue
+        for cg in cp.caregivers:
+            for other in schedule.conflicts(cg.id, slot):
+                st.warning(
+                    f"{t.content} ({slot.start_time:%H:%M}-{slot.end_time:%H:%M}) "
+                    f"overlaps with {cg.name}'s task {other.content} "
+                    f"({other.start_time:%H:%M}-{other.end_time:%H:%M}) "
+                    f"for {other.patient_name}"
+                )
 
 
 def task_list_changed():
     cp: CarePlan = st.session_state.cur_care_plan
+    times_changed = bool(st.session_state.task_list_changed["added_rows"]) or any(
+        "start_time" in edit or "end_time" in edit
+        for edit in st.session_state.task_list_changed["edited_rows"].values()
+    )
     if st.session_state.task_list_changed["deleted_rows"]:
         for r in sorted(
             st.session_state.task_list_changed["deleted_rows"], reverse=True
         ):
             del cp.tasks[r]
-        cp = st.session_state.db_client.update_care_plan(cp.id, tasks=cp.tasks)
 
     if st.session_state.task_list_changed["edited_rows"]:
         for r, edit in st.session_state.task_list_changed["edited_rows"].items():
@@ -192,8 +434,6 @@ def task_list_changed():
                 cp.tasks[r].end_time = time.fromisoformat(edit["end_time"])
             cp.tasks[r].updated_at = datetime.now()
 
-        cp = st.session_state.db_client.update_care_plan(cp.id, tasks=cp.tasks)
-
     if st.session_state.task_list_changed["added_rows"]:
         added = [
             Task(
@@ -209,9 +449,10 @@ def task_list_changed():
             if r.get("content")
         ]
         cp.tasks.extend(added)
-        cp = st.session_state.db_client.update_care_plan(cp.id, tasks=cp.tasks)
 
-    st.session_state.cur_care_plan = cp
+    st.session_state.write_behind.schedule(cp, tasks=True)
+    if times_changed and cp.caregivers:
+        warn_task_conflicts(cp)
 
 
 @st.fragment(run_every="5s")
@@ -219,9 +460,7 @@ def render_caregiver_status():
     cp: CarePlan = st.session_state.cur_care_plan
     caregiver_df = []
     for cg in cp.caregivers:
-        caregiver = DBClient(
-            st.secrets["SUPABASE_URL"], st.secrets["SUPABASE_KEY"]
-        ).get_user(user_id=cg.id)
+        caregiver = st.session_state.db_client.get_user(user_id=cg.id)
         name = (
             caregiver.user_metadata["first_name"]
             + " "
@@ -270,16 +509,96 @@ def delete_plan_cb():
     cp: CarePlan = st.session_state.get("cur_care_plan")
     if not cp:
         return
+    st.session_state.write_behind.discard(cp.id)
     st.session_state.db_client.delete_care_plan(cp.id)
+    st.session_state.plan_cache.discard(cp.id)
     st.session_state.pop("cur_care_plan", None)
 
 
 @st.fragment(run_every="5s")
 def refresh_care_plan():
+    for error in st.session_state.write_behind.pop_errors():
+        st.error(error)
+    attach_archived_keys()
     cp: CarePlan = st.session_state.get("cur_care_plan")
-    if not cp:
+    # local edits not yet written would be overwritten by the stored plan
+    if not cp or st.session_state.write_behind.is_dirty(cp.id):
         return
-    st.session_state.cur_care_plan = st.session_state.db_client.get_care_plan(cp.id)
+    fresh = st.session_state.db_client.get_care_plan(cp.id, with_notes=False)
+    if fresh:
+        # only notes past the last ones fetched are fetched
+        fresh.take_notes(cp)
+        fresh.add_fetched_notes(
+            st.session_state.db_client.get_caregiver_notes(
+                cp.id, since=cp.notes_cursor
+            )
+        )
+    st.session_state.cur_care_plan = fresh
+
+
+def attach_audio_key(
+    upload: Future[str],
+    care_plan_id: str,
+    items: list[Task | Question] | None = None,
+    note_id: int | None = None,
+):
+    """Point the items or note transcribed from a recording at its archive
+    upload. Callbacks don't wait for S3: if the upload is still running, the
+    key is stored by attach_archived_keys once it is done."""
+    if upload.done():
+        audio_key = archived_key(upload)
+        if audio_key and note_id is not None:
+            st.session_state.db_client.set_caregiver_note_audio_key(
+                care_plan_id, note_id, audio_key
+            )
+        for item in items or []:
+            item.audio_key = audio_key
+        return
+    st.session_state.setdefault("pending_audio", []).append(
+        {
+            "upload": upload,
+            "care_plan_id": care_plan_id,
+            "tasks": {i.content for i in items or [] if isinstance(i, Task)},
+            "questions": {
+                i.question for i in items or [] if isinstance(i, Question)
+            },
+            "note_id": note_id,
+        }
+    )
+
+
+def attach_archived_keys():
+    pending = st.session_state.get("pending_audio")
+    if not pending:
+        return
+    cp: CarePlan = st.session_state.get("cur_care_plan")
+    waiting = []
+    for p in pending:
+        # plan items are matched in the current plan, which may have been
+        # reloaded since, so keys of another plan wait until it is current
+        if not p["upload"].done() or (
+            p["note_id"] is None and (not cp or cp.id != p["care_plan_id"])
+        ):
+            waiting.append(p)
+            continue
+        audio_key = archived_key(p["upload"])
+        if not audio_key:
+            continue
+        if p["note_id"] is not None:
+            st.session_state.db_client.set_caregiver_note_audio_key(
+                p["care_plan_id"], p["note_id"], audio_key
+            )
+            continue
+        tasks = [t for t in cp.tasks if not t.audio_key and t.content in p["tasks"]]
+        questions = [
+            q for q in cp.questions if not q.audio_key and q.question in p["questions"]
+        ]
+        for item in tasks + questions:
+            item.audio_key = audio_key
+        st.session_state.write_behind.schedule(
+            cp, tasks=bool(tasks), questions=bool(questions)
+        )
+    st.session_state["pending_audio"] = waiting
 
 
 def render_tasks(disabled_columns: list[str]):
@@ -308,13 +627,15 @@ def render_tasks(disabled_columns: list[str]):
 
 def caregiver_note_cb():
     cp: CarePlan = st.session_state.cur_care_plan
-    idx = [cg.id for cg in cp.caregivers].index(st.session_state.user.id)
     note = st.session_state.get("caregiver_note")
     if not note:
         return
-    cp.caregivers[idx].notes.append(CaregiverNote(note))
-    st.session_state.db_client.update_caregiver_notes(
-        cp.id, st.session_state.user.id, cp.caregivers[idx].notes
+    cp.add_notes(
+        [
+            st.session_state.db_client.add_caregiver_note(
+                cp.id, st.session_state.user.id, note
+            )
+        ]
     )
 
 
@@ -325,22 +646,26 @@ def caregiver_audio_note_cb():
         or type(audio_note) != st.runtime.uploaded_file_manager.UploadedFile
     ):
         return
+    from chatbot import stream_transcript
+
     cp: CarePlan = st.session_state.cur_care_plan
-    idx = [cg.id for cg in cp.caregivers].index(st.session_state.user.id)
-    with st.spinner("Transcribing audio note"):
-        cp.caregivers[idx].notes.append(CaregiverNote(transcribe_audio(audio_note)))
-    st.session_state.db_client.update_caregiver_notes(
-        cp.id, st.session_state.user.id, cp.caregivers[idx].notes
+    upload = archive_audio(cp.id, audio_note.getvalue())
+    note = st.write_stream(stream_transcript(audio_note))
+    created = st.session_state.db_client.add_caregiver_note(
+        cp.id, st.session_state.user.id, note
     )
+    cp.add_notes([created])
+    attach_audio_key(upload, cp.id, note_id=created.id)
 
 
 def render_caregiver_notes(input: bool = False):
     cp: CarePlan = st.session_state.get("cur_care_plan")
     if not cp:
         return
-    if cp.caregiver_notes:
+    notes = cp.caregiver_notes
+    if notes:
         st.subheader("Caregiver Notes")
-    for note, name in cp.caregiver_notes:
+    for note, name in notes:
         with st.chat_message("user"):
             st.write(f"{name} ({note.created_at.strftime("%H:%M")}): {note.note}")
     if input:
@@ -406,6 +731,12 @@ def render_questions():
             key="question_list_changed",
             on_change=question_list_changed,
         )
+    if len(cp.questions) - len(answered_questions) > 1:
+        st.audio_input(
+            "Record all answers at once",
+            key="answer_all",
+            on_change=audio_answers_cb,
+        )
     q_col, a_col = st.columns(2)
     for i, q in enumerate(cp.questions):
         if q.answer:
@@ -424,28 +755,76 @@ def audio_answer_cb(idx: int):
     audio = st.session_state[f"answer_{idx}"]
     if audio is None or type(audio) != st.runtime.uploaded_file_manager.UploadedFile:
         return
-    with st.spinner("Generating answer transcript"):
-        cp.questions[idx].answer = transcribe_audio(audio, cp.questions[idx].question)
-        cp.questions[idx].updated_at = datetime.now()
+    from chatbot import stream_transcript
 
-    st.session_state.cur_care_plan = st.session_state.db_client.update_care_plan(
-        cp.id, questions=cp.questions
+    upload = archive_audio(cp.id, audio.getvalue())
+    cp.questions[idx].answer = st.write_stream(
+        stream_transcript(audio, cp.questions[idx].question)
     )
+    cp.questions[idx].updated_at = datetime.now()
+    attach_audio_key(upload, cp.id, [cp.questions[idx]])
+    st.session_state.write_behind.schedule(cp, questions=True)
+
+
+def audio_answers_cb():
+    audio = st.session_state.get("answer_all")
+    if audio is None or type(audio) != st.runtime.uploaded_file_manager.UploadedFile:
+        return
+    from chatbot import answer_questions_from_audio
+
+    cp: CarePlan = st.session_state.cur_care_plan
+    unanswered = [i for i, q in enumerate(cp.questions) if not q.answer]
+    if not unanswered:
+        return
+    upload = archive_audio(cp.id, audio.getvalue())
+    with st.spinner("Matching answers to questions"):
+        answers = answer_questions_from_audio(
+            audio, [cp.questions[i].question for i in unanswered]
+        )
+    now = datetime.now()
+    for j, answer in answers.items():
+        q = cp.questions[unanswered[j]]
+        q.answer = answer
+        q.updated_at = now
+    if answers:
+        attach_audio_key(upload, cp.id, [cp.questions[unanswered[j]] for j in answers])
+        st.session_state.write_behind.schedule(cp, questions=True)
+    if len(answers) < len(unanswered):
+        st.info(
+            f"{len(unanswered) - len(answers)} questions were not answered "
+            "in the recording"
+        )
 
 
 def audio_input_cb():
     audio = st.session_state.get("audio")
     if audio is None or type(audio) != st.runtime.uploaded_file_manager.UploadedFile:
         return
-    with st.spinner("Transcribing audio"):
-        tasks, questions = generate_tasks_from_audio(audio)
+    from chatbot import stream_tasks_from_audio
 
     cp: CarePlan = st.session_state.cur_care_plan
-    cp.tasks.extend(tasks)
-    cp.questions.extend(questions)
-    st.session_state.cur_care_plan = st.session_state.db_client.update_care_plan(
-        cp.id, tasks=cp.tasks, questions=cp.questions
-    )
+    upload = archive_audio(cp.id, audio.getvalue())
+    tasks, questions = [], []
+    with st.status("Transcribing audio", expanded=True) as status:
+        for item in stream_tasks_from_audio(audio):
+            if isinstance(item, Question):
+                questions.append(item)
+                st.write(f"Question: {item.question}")
+            else:
+                tasks.append(item)
+                st.write(f"Task: {item.content}")
+        attach_audio_key(upload, cp.id, tasks + questions)
+        # re-recorded instructions shouldn't pile up as duplicates
+        cp.tasks, dropped_tasks = merge_tasks(cp.tasks, tasks)
+        cp.questions, dropped_questions = merge_questions(cp.questions, questions)
+        label = "Transcribed audio"
+        if dropped_tasks or dropped_questions:
+            label += (
+                f", skipped {dropped_tasks + dropped_questions} "
+                "already in the care plan"
+            )
+        status.update(label=label, state="complete", expanded=False)
+    st.session_state.write_behind.schedule(cp, tasks=True, questions=True)
 
 
 @st.fragment(run_every="5s")
@@ -476,26 +855,41 @@ def render_content():
     render_caregiver_notes(input=True)
 
 
-def render_task_calendar(container):
-    dt = st.session_state.cur_care_plan["date"]
-    with container:
-        calendar_options["initialDate"] = dt
-        calendar(
-            events=[
-                {
-                    "start": datetime.combine(
-                        date.fromisoformat(dt), t["start_time"]
-                    ).isoformat(),
-                    "end": datetime.combine(
-                        date.fromisoformat(dt), t["end_time"]
-                    ).isoformat(),
-                    "title": t["content"],
-                }
-                for t in st.session_state.cur_care_plan["tasks"]
-                if t["start_time"]
-            ],
-            options=calendar_options,
-        )
+@st.cache_data(ttl="1m", show_spinner=False)
+def task_slot_index(
+    _db_client: DBClient, user_id: str, role: Role, start: date, end: date
+) -> TimeSlotIndex:
+    if role == Role.GUARDIAN:
+        rows = _db_client.get_care_plan_tasks(start, end, guardian_id=user_id)
+    else:
+        rows = _db_client.get_care_plan_tasks(start, end, caregiver_id=user_id)
+    return TimeSlotIndex.build(rows)
+
+
+def render_task_calendar():
+    from streamlit_calendar import calendar
+
+    today = date.today()
+    week_start = today - timedelta(days=today.weekday())
+    dates = st.date_input(
+        "Dates",
+        value=(week_start, week_start + timedelta(weeks=2, days=-1)),
+        key="task_calendar_dates",
+    )
+    if len(dates) != 2:
+        return
+    start, end = dates
+    role = Role(st.session_state.user.user_metadata["role"])
+    idx = task_slot_index(
+        st.session_state.db_client, st.session_state.user.id, role, start, end
+    )
+    if idx.overlapping:
+        st.warning(f"{len(idx.overlapping)} tasks overlap with another task")
+    calendar(
+        events=idx.calendar_events(start, end),
+        options={**calendar_options, "initialDate": start.isoformat()},
+        key=f"task_calendar_{start}_{end}",
+    )
 
 
 def render_care_plan():
@@ -505,6 +899,8 @@ def render_care_plan():
         return
     role = Role(st.session_state.user.user_metadata["role"])
     if role == Role.GUARDIAN and cp.date >= date.today():
+        from streamlit_extras.stylable_container import stylable_container
+
         with stylable_container(
             key="delete_care_plan",
             css_styles="""
@@ -561,13 +957,13 @@ def add_caregiver_cb():
     if st.session_state.get("caregiver_to_add"):
         # existing caregiver
         caregiver_id = st.session_state.caregivers[st.session_state.caregiver_to_add]
-        caregiver = cl.get_user(user_id=caregiver_id)
-        caregiver_name = f"{caregiver.user_metadata["first_name"]} {caregiver.user_metadata["last_name"]}"
-        caregiver.user_metadata["care_plan_id"] = cp.id
-        cl.update_user_metadata(caregiver_id, caregiver.user_metadata)
+        caregiver = st.session_state.db_client.get_caregivers_for_guardian(
+            cp.guardian_id, caregiver_id=caregiver_id
+        )[0]
+        caregiver_name = caregiver["caregiver_name"]
         try:
             st.session_state.db_client.sign_in_with_otp(
-                caregiver.email, st.secrets["REDIRECT_URL"]
+                caregiver["caregiver_email"], st.secrets["REDIRECT_URL"]
             )
         except AuthApiError as e:
             st.error(e)
@@ -581,7 +977,6 @@ def add_caregiver_cb():
             st.session_state.db_client.sign_in_with_otp(
                 st.session_state.invited_caregiver_email,
                 st.secrets["REDIRECT_URL"],
-                cp.id,
                 st.session_state.invited_caregiver_first_name,
                 st.session_state.invited_caregiver_last_name,
             )
@@ -640,18 +1035,84 @@ def add_caregiver(caregiver_ids_accepted: list[str] = []):
         if st.button("Invite a new caregiver", type="primary"):
             invite_new_caregiver()
 
+    with st.expander("Invite several caregivers"):
+        st.file_uploader(
+            "CSV with email, first_name and last_name columns",
+            type="csv",
+            key="invite_caregivers_csv",
+        )
+        st.button("Send invitations", on_click=invite_caregivers_cb)
+    render_invite_batch()
+
+
+def invite_caregivers_cb():
+    csv_file = st.session_state.get("invite_caregivers_csv")
+    if not csv_file:
+        st.error("Please upload a CSV of caregivers")
+        return
+    invites = parse_invites_csv(csv_file.getvalue())
+    if not invites:
+        st.error("No caregivers found in the CSV")
+        return
+    batch = InviteBatch(
+        st.session_state.db_client,
+        st.session_state.cur_care_plan,
+        invites,
+        st.secrets["REDIRECT_URL"],
+        st.secrets.get("INVITES_PER_SEC", INVITES_PER_SEC),
+    )
+    batch.start()
+    st.session_state["invite_batch"] = batch
+
+
+def render_invite_batch():
+    batch: InviteBatch = st.session_state.get("invite_batch")
+    if not batch or batch.cp.id != st.session_state.cur_care_plan.id:
+        return
+    if batch.error:
+        st.error(f"Inviting caregivers failed: {batch.error}")
+    elif not batch.done:
+        st.info("Sending invitations")
+    st.dataframe(
+        [
+            {
+                "email": i.email,
+                "name": i.name,
+                "status": i.status.value,
+                "attempts": i.attempts,
+                "error": i.error,
+            }
+            for i in batch.invites
+        ],
+        hide_index=True,
+        use_container_width=True,
+    )
+
 
 def create_care_plan_submit():
     dt = st.session_state.create_care_plan_date
+    until = st.session_state.create_care_plan_until or dt
     patient_name = st.session_state.create_care_plan_patient_name
     if not dt or not patient_name:
         st.error("Please provide the date and patient name")
         return
-    existing = st.session_state.db_client.get_care_plans(
-        dt=dt, patient_name=patient_name
-    )
+    if until < dt:
+        st.error("The last date can't be before the first date")
+        return
+    dates = [dt + timedelta(days=i) for i in range((until - dt).days + 1)]
+    summaries = {
+        (k["date"], k["patient_name"]): k["id"]
+        for k in st.session_state.db_client.get_care_plan_summaries(
+            st.session_state.user.id
+        )
+    }
+    name = patient_name.lower().strip()
+    existing = [d for d in dates if (d, name) in summaries]
     if existing:
-        st.error(f"A care plan already exists for {dt} and {patient_name}")
+        st.error(
+            f"A care plan already exists for {patient_name} on "
+            f"{", ".join(d.isoformat() for d in existing)}"
+        )
         return
 
     copy_dt = st.session_state.create_care_plan_copy_date
@@ -662,38 +1123,36 @@ def create_care_plan_submit():
         )
         return
 
-    tasks = []
-    questions = []
     if copy_dt and copy_patient:
-        cps = st.session_state.db_client.get_care_plans(
-            dt=copy_dt, patient_name=copy_patient
-        )
-        if not cps:
-            st.error(f"No existing care plan found for {dt} and {patient_name}")
+        source_id = summaries.get((copy_dt, copy_patient))
+        if not source_id:
+            st.error(f"No existing care plan found for {copy_dt} and {copy_patient}")
             return
-
-        copy_plan: CarePlan = cps[0]
-        tasks = [
-            Task(content=t.content, start_time=t.start_time, end_time=t.end_time)
-            for t in copy_plan.tasks
-        ]
-        questions = [Question(question=q.question) for q in copy_plan.questions]
-    st.session_state["cur_care_plan"] = st.session_state.db_client.create_care_plan(
-        guardian_id=st.session_state.user.id,
-        date=dt,
-        patient_name=patient_name,
-        tasks=tasks,
-        questions=questions,
-    )
+        ids = st.session_state.db_client.clone_care_plan(source_id, dates)
+        if not ids:
+            # deleted since the summaries were read
+            st.error(f"No existing care plan found for {copy_dt} and {copy_patient}")
+            return
+        cp = load_care_plan(ids[0])
+    else:
+        cp = None
+        for d in dates:
+            created = st.session_state.db_client.create_care_plan(
+                guardian_id=st.session_state.user.id, date=d, patient_name=patient_name
+            )
+            cp = cp or created
+    st.session_state["cur_care_plan"] = cp
     st.session_state["just_created"] = True
 
 
 def care_plans():
     st.session_state.pop("just_created", None)
-    care_plans: list[CarePlan] = st.session_state.db_client.get_care_plans(
-        guardian_id=st.session_state.user.id
-    )
-    care_plans = {(cp.date, cp.patient_name): cp for cp in care_plans}
+    care_plans = {
+        (k["date"], k["patient_name"]): k
+        for k in st.session_state.db_client.get_care_plan_summaries(
+            st.session_state.user.id
+        )
+    }
     sorted_dates = sorted({t[0] for t in care_plans.keys()}, reverse=True)
     names = list(set([t[1] for t in care_plans.keys()]))
 
@@ -707,7 +1166,19 @@ def care_plans():
             names,
             index=names.index(cp.patient_name) if cp else 0,
         )
-        cp = care_plans.get((dt, patient_name))
+        if st.secrets.get("SHOW_SESSION_MEMORY"):
+            st.sidebar.caption(
+                f"Session memory: {session_nbytes() / 1024:.1f} KiB "
+                f"({len(st.session_state.plan_cache)} cached plans)"
+            )
+        summary = care_plans.get((dt, patient_name))
+        if summary:
+            st.sidebar.caption(
+                f"{summary["done_count"]}/{summary["task_count"]} tasks done, "
+                f"{summary["unanswered_questions"]} unanswered questions, "
+                f"{summary["caregiver_count"]} caregivers"
+            )
+        cp = load_care_plan(summary["id"]) if summary else None
         if not cp:
             st.error(f"No existing care plan for date {dt} and patient {patient_name}")
             return
@@ -717,22 +1188,183 @@ def care_plans():
         st.error("No existing care plans found")
 
 
+def prefetch_caregiver_care_plans():
+    # today's plans are loaded in one go so switching between patients
+    # during a shift doesn't wait on the database
+    today = date.today()
+    if st.session_state.get("caregiver_plans_prefetched") == today:
+        return
+    for cp in st.session_state.db_client.get_caregiver_care_plans(
+        st.session_state.user.id, today
+    ):
+        st.session_state.plan_cache.put(cp)
+    st.session_state["caregiver_plans_prefetched"] = today
+
+
+def caregiver_care_plans():
+    prefetch_caregiver_care_plans()
+    care_plans = {
+        (k["date"], k["patient_name"]): k["id"]
+        for k in st.session_state.db_client.get_caregiver_care_plan_keys(
+            st.session_state.user.id
+        )
+    }
+    if not care_plans:
+        st.error("You have not been added to any care plans yet")
+        return
+    sorted_dates = sorted({t[0] for t in care_plans.keys()}, reverse=True)
+    cp: CarePlan = st.session_state.get("cur_care_plan")
+    if cp and cp.date in sorted_dates:
+        default_date = cp.date
+    else:
+        default_date = date.today() if date.today() in sorted_dates else sorted_dates[0]
+    dt = st.sidebar.selectbox(
+        "Dates", sorted_dates, index=sorted_dates.index(default_date)
+    )
+    names = sorted(name for d, name in care_plans.keys() if d == dt)
+    patient_name = st.sidebar.radio(
+        "Patients",
+        names,
+        index=names.index(cp.patient_name) if cp and cp.patient_name in names else 0,
+    )
+    cp = load_care_plan(care_plans[(dt, patient_name)])
+    if not cp:
+        st.error(f"No existing care plan for date {dt} and patient {patient_name}")
+        return
+    st.session_state["cur_care_plan"] = cp
+    st.subheader(f"Care plan for {cp.date} and {cp.patient_name}")
+    render_care_plan()
+
+
+def open_care_plan_cb(care_plan_id: str):
+    cp = load_care_plan(care_plan_id)
+    if cp:
+        st.session_state["cur_care_plan"] = cp
+        st.session_state["open_care_plan"] = True
+
+
+def render_search():
+    if st.session_state.pop("open_care_plan", False):
+        st.switch_page(care_plans_pg)
+        return
+    query = st.text_input(
+        "Search tasks, questions and caregiver notes",
+        placeholder='e.g. rash, "blood pressure", medication -evening',
+        key="search_query",
+    )
+    if not query:
+        return
+    hits = st.session_state.db_client.search_care_plans(
+        st.session_state.user.id, query
+    )
+    if not hits:
+        st.info(f"Nothing found for {query}")
+        return
+    for i, h in enumerate(hits):
+        col1, col2 = st.columns([5, 1])
+        col1.markdown(
+            f"**{h["date"]}, {h["patient_name"]}** ({h["kind"]}): {h["headline"]}"
+        )
+        col2.button(
+            "Open",
+            key=f"search_hit_{i}",
+            on_click=open_care_plan_cb,
+            args=[h["care_plan_id"]],
+        )
+
+
+@st.cache_data(ttl="5m", show_spinner=False)
+def analytics_frames(_db_client: DBClient, guardian_id: str, start: date, end: date):
+    import analytics
+
+    return (
+        analytics.metrics_frame(_db_client.get_daily_metrics(guardian_id, start, end)),
+        analytics.assignments_frame(
+            _db_client.get_guardian_caregiver_assignments(guardian_id, start, end)
+        ),
+    )
+
+
+def refresh_analytics_cb():
+    # the metrics view itself is refreshed hourly in the database (sql/005)
+    analytics_frames.clear()
+
+
+def render_analytics():
+    import analytics
+
+    today = date.today()
+    col1, col2 = st.columns([4, 1])
+    dates = col1.date_input(
+        "Dates", value=(today - timedelta(days=30), today), key="analytics_dates"
+    )
+    col2.button(
+        "Refresh",
+        on_click=refresh_analytics_cb,
+        help="Metrics are updated every hour",
+    )
+    if len(dates) != 2:
+        return
+    metrics, assignments = analytics_frames(
+        st.session_state.db_client, st.session_state.user.id, *dates
+    )
+    if metrics.empty:
+        st.info("No care plans in this date range")
+        return
+
+    columns = {
+        "plans": st.column_config.NumberColumn("Plans"),
+        "completion_rate": st.column_config.NumberColumn(
+            "Tasks done", format="percent"
+        ),
+        "on_time_rate": st.column_config.NumberColumn("On time", format="percent"),
+        "answer_rate": st.column_config.NumberColumn(
+            "Questions answered", format="percent"
+        ),
+        "avg_answer_hours": st.column_config.NumberColumn(
+            "Avg. answer time (h)", format="%.1f"
+        ),
+    }
+    st.altair_chart(analytics.daily_completion_chart(metrics), use_container_width=True)
+    st.subheader("Per patient")
+    st.dataframe(
+        analytics.by_patient(metrics),
+        column_order=["patient_name", *columns],
+        column_config={"patient_name": "Patient", **columns},
+        hide_index=True,
+        use_container_width=True,
+    )
+    st.subheader("Per caregiver")
+    st.dataframe(
+        analytics.by_caregiver(metrics, assignments),
+        column_order=["caregiver", *columns],
+        column_config={"caregiver": "Caregiver", **columns},
+        hide_index=True,
+        use_container_width=True,
+    )
+
+
 def create_care_plan():
     if st.session_state.get("just_created"):
         st.switch_page(care_plans_pg)
         return
 
-    care_plans: list[CarePlan] = st.session_state.db_client.get_care_plans(
-        guardian_id=st.session_state.user.id
+    care_plans = st.session_state.db_client.get_care_plan_summaries(
+        st.session_state.user.id
     )
-    care_plans = {(cp.date, cp.patient_name): cp for cp in care_plans}
-    sorted_dates = sorted({t[0] for t in care_plans.keys()}, reverse=True)
-    names = list(set([t[1] for t in care_plans.keys()]))
+    sorted_dates = sorted({k["date"] for k in care_plans}, reverse=True)
+    names = list(set([k["patient_name"] for k in care_plans]))
 
     with st.form("create_care_plan_form", clear_on_submit=True):
         st.date_input(
             "Date", value=None, min_value=date.today(), key="create_care_plan_date"
         )
+        st.date_input(
+            "Repeat daily until",
+            value=None,
+            min_value=date.today(),
+            key="create_care_plan_until",
+        )
         st.text_input("Patient Name", key="create_care_plan_patient_name")
         st.write("Copy details from existing care plan")
         col1, col2 = st.columns(2)
@@ -751,6 +1383,16 @@ create_care_plan_pg = st.Page(
 care_plans_pg = st.Page(
     care_plans, title="Care Plans", icon=":material/mic:", default=True
 )
+caregiver_care_plans_pg = st.Page(
+    caregiver_care_plans, title="Care Plans", icon=":material/mic:"
+)
+search_pg = st.Page(render_search, title="Search", icon=":material/search:")
+analytics_pg = st.Page(
+    render_analytics, title="Analytics", icon=":material/monitoring:"
+)
+task_calendar_pg = st.Page(
+    render_task_calendar, title="Calendar", icon=":material/calendar_month:"
+)
 
 
 def main():
@@ -759,20 +1401,34 @@ def main():
         page_title="Relait", page_icon=":partner_exchange:", layout="wide"
     )
     init_connection()
+    if not st.session_state.get("user"):
+        restore_session()
 
     if st.session_state.get("user"):
+        write_session_cookie()
+        keep_session_fresh()
+        render_reminders()
         refresh_care_plan()
         role = Role(st.session_state.user.user_metadata["role"])
         if role == Role.GUARDIAN:
-            st.navigation([create_care_plan_pg, care_plans_pg]).run()
+            st.navigation(
+                [
+                    create_care_plan_pg,
+                    care_plans_pg,
+                    task_calendar_pg,
+                    search_pg,
+                    analytics_pg,
+                ]
+            ).run()
         else:
-            render_care_plan()
+            st.navigation([caregiver_care_plans_pg, task_calendar_pg]).run()
     elif "reset_password" in st.query_params:
         fragment = get_fragment()
         if fragment:
             acces_token = (fragment.split("access_token=")[1]).split("&")[0]
-            payload = jwt.decode(acces_token, options={"verify_signature": False})
-            reset_password(payload["email"], payload["sub"])
+            payload = verified_claims(acces_token)
+            if payload:
+                reset_password(payload["email"], payload["sub"])
     elif "add_caregiver" in st.query_params:
         fragment = get_fragment()
         if fragment:
@@ -783,21 +1439,24 @@ def main():
                     caregiver_invites_themselves()
                 return
             acces_token = fields[1].split("&")[0]
-            payload = jwt.decode(acces_token, options={"verify_signature": False})
-            user_id = payload["sub"]
-            care_plan_id = payload["user_metadata"]["care_plan_id"]
-            st.session_state["cur_care_plan"] = (
-                st.session_state.db_client.get_care_plan(care_plan_id)
-            )
-            if not st.session_state["cur_care_plan"]:
-                st.error("No care plan found")
+            payload = verified_claims(acces_token)
+            if not payload:
+                if not st.session_state.get("reinvite_sent"):
+                    caregiver_invites_themselves()
                 return
-            st.session_state["user"] = st.session_state.db_client.get_user(
-                jwt=acces_token
-            )
-            st.session_state.db_client.update_caregiver_status(
-                care_plan_id, user_id, Caregiver_Status.ACCEPTED
-            )
+            from auth import TokenUser
+
+            user_id = payload["sub"]
+            st.session_state["user"] = TokenUser.from_claims(payload)
+            params = parse_qs(fragment)
+            if params.get("refresh_token"):
+                persist_session(
+                    user_id,
+                    acces_token,
+                    params["refresh_token"][0],
+                    params.get("expires_at", [payload["exp"]])[0],
+                )
+            st.session_state.db_client.accept_caregiver_invitations(user_id)
             st.rerun()
     else:
         register_login()
@@ -0,0 +1,55 @@
+from collections import OrderedDict
+import pickle
+from store import CarePlan
+
+DEFAULT_BUDGET_BYTES = 2 * 1024 * 1024
+
+
+def plan_nbytes(cp: CarePlan) -> int:
+    return len(pickle.dumps(cp, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+class PlanCache:
+    """LRU of recently viewed care plans, bounded by their pickled size.
+
+    The active plan lives in st.session_state.cur_care_plan; this only keeps
+    the plans a user switched away from so switching back is cheap.
+    """
+
+    def __init__(self, budget_bytes: int = DEFAULT_BUDGET_BYTES):
+        self.budget_bytes = budget_bytes
+        self.nbytes = 0
+        self._plans: OrderedDict[str, tuple[CarePlan, int]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._plans)
+
+    def __contains__(self, care_plan_id: str) -> bool:
+        return care_plan_id in self._plans
+
+    def get(self, care_plan_id: str) -> CarePlan | None:
+        entry = self._plans.get(care_plan_id)
+        if not entry:
+            return None
+        self._plans.move_to_end(care_plan_id)
+        return entry[0]
+
+    def put(self, cp: CarePlan):
+        self.discard(cp.id)
+        size = plan_nbytes(cp)
+        if size > self.budget_bytes:
+            return
+        self._plans[cp.id] = (cp, size)
+        self.nbytes += size
+        while self.nbytes > self.budget_bytes:
+            _, (_, evicted) = self._plans.popitem(last=False)
+            self.nbytes -= evicted
+
+    def discard(self, care_plan_id: str):
+        entry = self._plans.pop(care_plan_id, None)
+        if entry:
+            self.nbytes -= entry[1]
+
+    def clear(self):
+        self._plans.clear()
+        self.nbytes = 0
@@ -0,0 +1,324 @@
+from collections import defaultdict, deque
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta
+from enum import Enum
+from itertools import count
+from typing import Callable, Iterable
+import heapq
+import json
+import logging
+import threading
+import urllib.request
+from shared_cache import SharedCache
+from store import DBClient, CarePlan, Task
+
+REMINDER_LEAD_SECS = 300.0
+RELOAD_SECS = 300.0
+RETRY_SECS = 30.0
+IN_APP_QUEUE_LEN = 50
+LOAD_PAGE_SIZE = 500
+# longer than a reminder can be late, its key has its time of day
+SEND_CLAIM_SECS = 24 * 3600.0
+
+logger = logging.getLogger(__name__)
+
+
+class Reminder_Kind(Enum):
+    DUE = "DUE"
+    OVERDUE = "OVERDUE"
+
+
+@dataclass(slots=True)
+class Reminder:
+    kind: Reminder_Kind
+    at: datetime
+    care_plan_id: str
+    patient_name: str
+    task: Task
+    recipients: list[str]
+
+    @property
+    def message(self) -> str:
+        if self.kind == Reminder_Kind.DUE:
+            return (
+                f"{self.patient_name}: {self.task.content} "
+                f"at {self.task.start_time.strftime('%H:%M')}"
+            )
+        return (
+            f"{self.patient_name}: {self.task.content} "
+            f"was due by {self.task.end_time.strftime('%H:%M')}"
+        )
+
+
+class InAppNotifier:
+    """Keeps the latest reminders of each user until one of their sessions
+    drains them."""
+
+    def __init__(self, maxlen: int = IN_APP_QUEUE_LEN):
+        self._queues: dict[str, deque[Reminder]] = defaultdict(
+            lambda: deque(maxlen=maxlen)
+        )
+        self._lock = threading.Lock()
+
+    def __call__(self, reminder: Reminder):
+        with self._lock:
+            for user_id in reminder.recipients:
+                self._queues[user_id].append(reminder)
+
+    def drain(self, user_id: str) -> list[Reminder]:
+        with self._lock:
+            queue = self._queues.pop(user_id, None)
+        return list(queue) if queue else []
+
+
+class WebhookNotifier:
+    """POSTs each reminder as json, for push or SMS gateways."""
+
+    def __init__(self, url: str, timeout: float = 5.0):
+        self.url = url
+        self.timeout = timeout
+
+    def __call__(self, reminder: Reminder):
+        body = json.dumps(
+            {
+                "kind": reminder.kind.value,
+                "at": reminder.at.isoformat(),
+                "care_plan_id": reminder.care_plan_id,
+                "recipients": reminder.recipients,
+                "message": reminder.message,
+            }
+        ).encode()
+        req = urllib.request.Request(
+            self.url, body, {"Content-Type": "application/json"}
+        )
+        urllib.request.urlopen(req, timeout=self.timeout).close()
+
+
+class ClaimedNotifier:
+    """Passes a reminder on to notifier in only one server process.
+
+    Every process runs its own ReminderEngine, so external notifications
+    would go out once per process. The first process to claim a reminder in
+    the shared cache sends it; claiming each reminder, rather than electing
+    one sender, still sends the ones only the process that saw the write
+    knows about yet.
+    """
+
+    def __init__(
+        self,
+        notifier: Callable[[Reminder], None],
+        cache: SharedCache,
+        claim_secs: float = SEND_CLAIM_SECS,
+    ):
+        self.notifier = notifier
+        self.cache = cache
+        self.claim_secs = claim_secs
+
+    def __call__(self, reminder: Reminder):
+        key = (
+            f"reminder:{reminder.care_plan_id}:{reminder.kind.value}:"
+            f"{reminder.at.isoformat()}:{reminder.task.content}"
+        )
+        if self.cache.claim(key, self.claim_secs):
+            self.notifier(reminder)
+
+
+@dataclass(slots=True)
+class _Plan:
+    guardian_id: str
+    patient_name: str
+    caregiver_ids: list[str]
+    tasks: list[Task]
+    generation: int = 0
+    # heap entries of the current generation not yet popped
+    pending: int = 0
+
+    @staticmethod
+    def from_care_plan(cp: CarePlan):
+        return _Plan(
+            cp.guardian_id,
+            cp.patient_name,
+            [cg.id for cg in cp.caregivers],
+            cp.tasks,
+        )
+
+
+class ReminderEngine:
+    """Reminds caregivers of today's tasks from a background thread.
+
+    Every task of today's plans that isn't done has a heap entry at its start
+    time, less the lead, and one at its end time for when it is overdue.
+    Entries carry their plan's generation; a write to the plan bumps it and
+    pushes fresh entries, so stale ones are skipped when they come up instead
+    of being searched for. The plans are reloaded every reload_secs to pick
+    up writes made by other server processes, and when the day changes.
+    """
+
+    def __init__(
+        self,
+        db_client: DBClient,
+        notifiers: Iterable[Callable[[Reminder], None]],
+        lead_secs: float = REMINDER_LEAD_SECS,
+        reload_secs: float = RELOAD_SECS,
+    ):
+        self.db_client = db_client
+        self.notifiers = list(notifiers)
+        self.lead = timedelta(seconds=lead_secs)
+        self.reload_secs = reload_secs
+        self.day: date | None = None
+        self._plans: dict[str, _Plan] = {}
+        self._heap: list[tuple[datetime, int, str, int, int, Reminder_Kind]] = []
+        self._seq = count()
+        self._live = 0
+        self._refetch: set[str] = set()
+        self._reload_at = datetime.min
+        self._cond = threading.Condition()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def __len__(self) -> int:
+        return self._live
+
+    def on_write(self, care_plan_id: str, update: dict | None = None):
+        """DBClient listener, see DBClient.listeners."""
+        with self._cond:
+            plan = self._plans.get(care_plan_id)
+            if update is None:
+                # new or deleted plan, or new caregivers
+                self._refetch.add(care_plan_id)
+            elif plan and "tasks" in update:
+                plan.tasks = [Task.deserialize_from_db(t) for t in update["tasks"]]
+                self._schedule(care_plan_id, plan, datetime.now())
+            else:
+                return
+            self._cond.notify()
+
+    def _schedule(self, care_plan_id: str, plan: _Plan, now: datetime):
+        plan.generation += 1
+        self._live -= plan.pending
+        plan.pending = 0
+        for i, t in enumerate(plan.tasks):
+            if t.status or not t.start_time:
+                continue
+            due = datetime.combine(self.day, t.start_time) - self.lead
+            entries = [(due, Reminder_Kind.DUE)]
+            if t.end_time:
+                entries.append(
+                    (datetime.combine(self.day, t.end_time), Reminder_Kind.OVERDUE)
+                )
+            for at, kind in entries:
+                if at > now:
+                    heapq.heappush(
+                        self._heap,
+                        (at, next(self._seq), care_plan_id, plan.generation, i, kind),
+                    )
+                    plan.pending += 1
+        self._live += plan.pending
+        # drop stale entries once they outnumber the live ones
+        if len(self._heap) > 2 * self._live + 1024:
+            self._heap = [e for e in self._heap if self._is_live(e)]
+            heapq.heapify(self._heap)
+
+    def _is_live(self, entry) -> bool:
+        plan = self._plans.get(entry[2])
+        return plan is not None and plan.generation == entry[3]
+
+    def _drop(self, care_plan_id: str):
+        plan = self._plans.pop(care_plan_id, None)
+        if plan:
+            self._live -= plan.pending
+
+    def run(self):
+        while True:
+            try:
+                self._step()
+            except Exception:
+                logger.exception("reminder engine step failed")
+                with self._cond:
+                    self._cond.wait(RETRY_SECS)
+
+    def _step(self):
+        now = datetime.now()
+        if now.date() != self.day or now >= self._reload_at:
+            self._reload(now)
+        with self._cond:
+            refetch, self._refetch = self._refetch, set()
+        for care_plan_id in refetch:
+            self._fetch(care_plan_id)
+
+        reminders = []
+        with self._cond:
+            now = datetime.now()
+            while self._heap and self._heap[0][0] <= now:
+                entry = heapq.heappop(self._heap)
+                if not self._is_live(entry):
+                    continue
+                at, _, care_plan_id, _, i, kind = entry
+                plan = self._plans[care_plan_id]
+                plan.pending -= 1
+                self._live -= 1
+                recipients = list(plan.caregiver_ids)
+                if kind == Reminder_Kind.OVERDUE:
+                    recipients.append(plan.guardian_id)
+                reminders.append(
+                    Reminder(
+                        kind,
+                        at,
+                        care_plan_id,
+                        plan.patient_name,
+                        plan.tasks[i],
+                        recipients,
+                    )
+                )
+            if not reminders and not self._refetch:
+                wake = min(
+                    self._reload_at,
+                    datetime.combine(now.date() + timedelta(days=1), time()),
+                )
+                if self._heap:
+                    wake = min(wake, self._heap[0][0])
+                self._cond.wait((wake - now).total_seconds())
+
+        for r in reminders:
+            for notify in self.notifiers:
+                try:
+                    notify(r)
+                except Exception:
+                    logger.exception("reminder notifier %r failed", notify)
+
+    def _reload(self, now: datetime):
+        plans = {
+            cp.id: _Plan.from_care_plan(cp)
+            for page in self.db_client.iter_care_plans(
+                start=now.date(),
+                end=now.date(),
+                page_size=LOAD_PAGE_SIZE,
+                with_notes=False,
+            )
+            for cp in page
+        }
+        with self._cond:
+            self.day = now.date()
+            self._plans = plans
+            self._heap = []
+            self._live = 0
+            for care_plan_id, plan in plans.items():
+                self._schedule(care_plan_id, plan, now)
+            self._reload_at = now + timedelta(seconds=self.reload_secs)
+        logger.info("reminders: %d tasks of %d plans", self._live, len(plans))
+
+    def _fetch(self, care_plan_id: str):
+        cp = self.db_client.get_care_plan(care_plan_id, with_notes=False)
+        with self._cond:
+            if not cp or cp.date != self.day:
+                self._drop(care_plan_id)
+                return
+            plan = _Plan.from_care_plan(cp)
+            old = self._plans.get(care_plan_id)
+            if old:
+                self._live -= old.pending
+                plan.generation = old.generation
+            self._plans[care_plan_id] = plan
+            self._schedule(care_plan_id, plan, datetime.now())
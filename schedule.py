@@ -0,0 +1,239 @@
+from dataclasses import dataclass, field
+from datetime import date, datetime, time
+import heapq
+from store import Task
+from utils import minutes_of_day
+
+OVERLAP_COLOR = "#d33"
+DEFAULT_TASK_MINS = 30
+
+
+@dataclass(slots=True)
+class Slot:
+    care_plan_id: str
+    patient_name: str
+    day: date
+    task_idx: int
+    content: str
+    status: bool
+    start: int  # minutes since midnight
+    end: int
+
+    @property
+    def start_time(self) -> time:
+        return minutes_to_time(self.start)
+
+    @property
+    def end_time(self) -> time:
+        return minutes_to_time(self.end)
+
+
+def minutes_to_time(minutes: int) -> time:
+    if minutes >= 24 * 60:
+        return time.max
+    return time(hour=minutes // 60, minute=minutes % 60)
+
+
+def task_slot(
+    care_plan_id: str, patient_name: str, day: date, task_idx: int, task: Task
+) -> Slot | None:
+    if not task.start_time:
+        return None
+    start = minutes_of_day(task.start_time)
+    end = minutes_of_day(task.end_time) if task.end_time else start
+    if end <= start:
+        # no end or one before the start: the default length, which for a
+        # late task is cut off at midnight rather than wrapping to hour 24
+        end = min(start + DEFAULT_TASK_MINS, 24 * 60)
+    return Slot(
+        care_plan_id,
+        patient_name,
+        day,
+        task_idx,
+        task.content,
+        task.status,
+        start,
+        end,
+    )
+
+
+@dataclass(slots=True)
+class TimeSlotIndex:
+    """Timed tasks of several care plans, bucketed per day and sorted by start."""
+
+    days: dict[date, list[Slot]] = field(default_factory=dict)
+    # keys of the slots that overlap another slot on the same day
+    overlapping: set[tuple[date, int, int, str, int]] = field(default_factory=set)
+
+    @staticmethod
+    def build(care_plans: list[dict]) -> "TimeSlotIndex":
+        """care_plans are raw rows with id, date, patient_name and tasks."""
+        idx = TimeSlotIndex()
+        for cp in care_plans:
+            day = date.fromisoformat(cp["date"])
+            slots = idx.days.setdefault(day, [])
+            for i, t in enumerate(cp["tasks"]):
+                slot = task_slot(
+                    cp["id"], cp["patient_name"], day, i, Task.deserialize_from_db(t)
+                )
+                if slot:
+                    slots.append(slot)
+        for day, slots in idx.days.items():
+            slots.sort(key=lambda s: (s.start, s.end))
+            for a, b in overlaps(slots):
+                idx.overlapping.add(slot_key(a))
+                idx.overlapping.add(slot_key(b))
+        return idx
+
+    def is_overlapping(self, slot: Slot) -> bool:
+        return slot_key(slot) in self.overlapping
+
+    def slots(self, start: date, end: date) -> list[Slot]:
+        return [
+            s
+            for day in sorted(self.days)
+            if start <= day <= end
+            for s in self.days[day]
+        ]
+
+    def calendar_events(self, start: date, end: date) -> list[dict]:
+        events = []
+        for s in self.slots(start, end):
+            event = {
+                "title": f"{s.patient_name}: {s.content}",
+                "start": datetime.combine(s.day, s.start_time).isoformat(),
+                "end": datetime.combine(s.day, s.end_time).isoformat(),
+            }
+            if self.is_overlapping(s):
+                event["color"] = OVERLAP_COLOR
+            events.append(event)
+        return events
+
+
+def slot_key(slot: Slot) -> tuple[date, int, int, str, int]:
+    return (slot.day, slot.start, slot.end, slot.care_plan_id, slot.task_idx)
+
+
+def overlaps(slots: list[Slot]) -> list[tuple[Slot, Slot]]:
+    """Pairs of overlapping slots; slots must be sorted by start."""
+    found = []
+    active: list[tuple[int, int]] = []  # (end, position in slots)
+    for i, s in enumerate(slots):
+        while active and active[0][0] <= s.start:
+            heapq.heappop(active)
+        found.extend((slots[j], s) for _, j in active)
+        heapq.heappush(active, (s.end, i))
+    return found
+
+
+class IntervalTree:
+    """Static interval tree over slots.
+
+    The slots are sorted by start and read as an implicit balanced binary
+    search tree, where the middle of every range is its root. max_end[i] holds
+    the latest end in the subtree rooted at i, which lets queries skip whole
+    subtrees that end before the queried interval.
+    """
+
+    def __init__(self, slots: list[Slot]):
+        self.slots = sorted(slots, key=lambda s: (s.start, s.end))
+        self.max_end = [0] * len(self.slots)
+        self._build(0, len(self.slots))
+
+    def __len__(self) -> int:
+        return len(self.slots)
+
+    def _build(self, lo: int, hi: int) -> int:
+        if lo >= hi:
+            return -1
+        mid = (lo + hi) // 2
+        self.max_end[mid] = max(
+            self.slots[mid].end, self._build(lo, mid), self._build(mid + 1, hi)
+        )
+        return self.max_end[mid]
+
+    def _query(self, lo: int, hi: int, start: int, end: int, found: list, limit):
+        if lo >= hi or (limit and len(found) >= limit):
+            return
+        mid = (lo + hi) // 2
+        if self.max_end[mid] <= start:
+            return
+        self._query(lo, mid, start, end, found, limit)
+        s = self.slots[mid]
+        if s.start >= end:
+            return
+        if s.end > start and not (limit and len(found) >= limit):
+            found.append(s)
+        self._query(mid + 1, hi, start, end, found, limit)
+
+    def overlapping(self, start: int, end: int) -> list[Slot]:
+        """Slots overlapping [start, end), ordered by start."""
+        found = []
+        self._query(0, len(self.slots), start, end, found, None)
+        return found
+
+    def is_free(self, start: int, end: int) -> bool:
+        found = []
+        self._query(0, len(self.slots), start, end, found, 1)
+        return not found
+
+    def free_slots(
+        self, start: int, end: int, duration: int = 30
+    ) -> list[tuple[int, int]]:
+        """Gaps of at least duration minutes within [start, end)."""
+        gaps = []
+        cur = start
+        for s in self.overlapping(start, end):
+            if s.start - cur >= duration:
+                gaps.append((cur, s.start))
+            cur = max(cur, s.end)
+        if end - cur >= duration:
+            gaps.append((cur, end))
+        return gaps
+
+
+class CaregiverSchedule:
+    """Interval trees of every caregiver's tasks, per day, across care plans."""
+
+    def __init__(self, assignments: list[dict]):
+        """assignments are caregiver_notes rows with caregiver_id and the
+        embedded care_plan (id, date, patient_name, tasks)."""
+        slots: dict[tuple[str, date], list[Slot]] = {}
+        for a in assignments:
+            cp = a["care_plan"]
+            day = date.fromisoformat(cp["date"])
+            bucket = slots.setdefault((a["caregiver_id"], day), [])
+            for i, t in enumerate(cp["tasks"]):
+                slot = task_slot(
+                    cp["id"], cp["patient_name"], day, i, Task.deserialize_from_db(t)
+                )
+                if slot:
+                    bucket.append(slot)
+        self.trees = {k: IntervalTree(v) for k, v in slots.items()}
+
+    def tree(self, caregiver_id: str, day: date) -> IntervalTree:
+        return self.trees.get((caregiver_id, day)) or IntervalTree([])
+
+    def conflicts(self, caregiver_id: str, slot: Slot) -> list[Slot]:
+        """Tasks of the caregiver's other care plans overlapping slot."""
+        return [
+            s
+            for s in self.tree(caregiver_id, slot.day).overlapping(slot.start, slot.end)
+            if s.care_plan_id != slot.care_plan_id
+        ]
+
+    def free_slots(
+        self,
+        caregiver_id: str,
+        day: date,
+        start: time = time(hour=0),
+        end: time = time.max,
+        duration: int = 30,
+    ) -> list[tuple[time, time]]:
+        end_min = 24 * 60 if end == time.max else minutes_of_day(end)
+        return [
+            (minutes_to_time(s), minutes_to_time(e))
+            for s, e in self.tree(caregiver_id, day).free_slots(
+                minutes_of_day(start), end_min, duration
+            )
+        ]
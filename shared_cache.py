@@ -0,0 +1,146 @@
+import pickle
+import sqlite3
+import threading
+import time
+from typing import Any, Callable
+
+DEFAULT_TTL_SECS = 5.0
+LEASE_SECS = 10.0
+WAIT_POLL_SECS = 0.05
+
+
+class SharedCache:
+    """Cache shared by every server process on a host, stored in SQLite (WAL).
+
+    Entries carry a version that invalidate() bumps. A stale entry is
+    refetched by whichever process first takes its lease; the others keep
+    serving the stale value (or wait for the new one if there is none), so
+    each stale key is fetched once per host instead of once per session.
+    A fetch that races with an invalidation is not stored, since its value
+    may predate the write that caused the invalidation.
+    """
+
+    def __init__(self, path: str, ttl: float = DEFAULT_TTL_SECS):
+        self.path = path
+        self.ttl = ttl
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.execute("pragma journal_mode=wal")
+            conn.execute(
+                """
+                create table if not exists cache (
+                    key text primary key,
+                    version integer not null default 0,
+                    value blob,
+                    fetched_at real not null default 0,
+                    lease_until real not null default 0
+                )
+                """
+            )
+            conn.execute(
+                """
+                create table if not exists claim (
+                    key text primary key,
+                    until real not null
+                )
+                """
+            )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("pragma synchronous=normal")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str, fetch: Callable[[], Any], ttl: float | None = None):
+        ttl = self.ttl if ttl is None else ttl
+        deadline = time.time() + LEASE_SECS
+        while True:
+            now = time.time()
+            row = (
+                self._conn()
+                .execute(
+                    "select value, fetched_at from cache where key = ?", (key,)
+                )
+                .fetchone()
+            )
+            if row and row[0] is not None and now - row[1] < ttl:
+                return pickle.loads(row[0])
+            version = self._lease(key, now)
+            if version is not None:
+                break
+            if row and row[0] is not None:
+                return pickle.loads(row[0])
+            if now > deadline:
+                # the lease holder is taking too long, don't hang the page
+                return fetch()
+            time.sleep(WAIT_POLL_SECS)
+
+        try:
+            value = fetch()
+        except BaseException:
+            self._release(key)
+            raise
+        self._conn().execute(
+            """
+            update cache set value = ?, fetched_at = ?, lease_until = 0
+            where key = ? and version = ?
+            """,
+            (pickle.dumps(value, pickle.HIGHEST_PROTOCOL), time.time(), key, version),
+        )
+        self._release(key)
+        return value
+
+    def _lease(self, key: str, now: float) -> int | None:
+        conn = self._conn()
+        conn.execute("begin immediate")
+        try:
+            row = conn.execute(
+                "select version, lease_until from cache where key = ?", (key,)
+            ).fetchone()
+            if row and row[1] > now:
+                return None
+            conn.execute(
+                """
+                insert into cache (key, lease_until) values (?, ?)
+                on conflict (key) do update set lease_until = excluded.lease_until
+                """,
+                (key, now + LEASE_SECS),
+            )
+            return row[0] if row else 0
+        finally:
+            conn.execute("commit")
+
+    def _release(self, key: str):
+        self._conn().execute("update cache set lease_until = 0 where key = ?", (key,))
+
+    def claim(self, key: str, secs: float) -> bool:
+        """True for the first caller on the host to claim key, until the claim
+        lapses after secs."""
+        now = time.time()
+        conn = self._conn()
+        conn.execute("begin immediate")
+        try:
+            conn.execute("delete from claim where until <= ?", (now,))
+            return (
+                conn.execute(
+                    "insert into claim (key, until) values (?, ?) "
+                    "on conflict (key) do nothing",
+                    (key, now + secs),
+                ).rowcount
+                == 1
+            )
+        finally:
+            conn.execute("commit")
+
+    def invalidate(self, prefix: str):
+        """Drop every entry whose key starts with prefix."""
+        self._conn().execute(
+            """
+            update cache set version = version + 1, value = null, fetched_at = 0
+            where substr(key, 1, ?) = ?
+            """,
+            (len(prefix), prefix),
+        )
@@ -0,0 +1,28 @@
+-- Caregiver notes as append-only rows instead of a jsonb array on
+-- caregiver_notes, so appending a note is a single insert and clients can
+-- page through a plan's notes by id.
+create table if not exists caregiver_note (
+    id bigint generated always as identity primary key,
+    care_plan_id uuid not null references care_plan (id) on delete cascade,
+    caregiver_id uuid not null,
+    note text not null,
+    created_at timestamptz not null default now()
+);
+
+create index if not exists caregiver_note_care_plan_id_created_at_idx
+    on caregiver_note (care_plan_id, created_at);
+-- refreshes fetch the notes past the highest id they have seen
+create index if not exists caregiver_note_care_plan_id_id_idx
+    on caregiver_note (care_plan_id, id);
+
+-- legacy notes only carried a time of day, anchor them on the plan's date
+insert into caregiver_note (care_plan_id, caregiver_id, note, created_at)
+select cn.care_plan_id,
+       cn.caregiver_id,
+       n ->> 'note',
+       cp.date + (n ->> 'created_at')::time
+from caregiver_notes cn
+join care_plan cp on cp.id = cn.care_plan_id
+cross join lateral jsonb_array_elements(coalesce(cn.notes, '[]'::jsonb)) n;
+
+update caregiver_notes set notes = '[]'::jsonb;
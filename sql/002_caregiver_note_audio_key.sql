@@ -0,0 +1,2 @@
+-- object key of the archived recording a note was transcribed from
+alter table caregiver_note add column if not exists audio_key text;
@@ -0,0 +1,17 @@
+-- Server side sessions: the browser only keeps the opaque id in a cookie,
+-- the tokens stay here so a reload can restore the user without signing in
+create table if not exists user_session (
+    id uuid primary key default gen_random_uuid(),
+    user_id uuid not null,
+    access_token text not null,
+    refresh_token text not null,
+    expires_at bigint not null,
+    created_at timestamptz not null default now(),
+    updated_at timestamptz not null default now()
+);
+
+create index if not exists user_session_user_id_idx on user_session (user_id);
+
+-- only the service role may read tokens, DBClient goes through its
+-- service_client since its main client is switched to the user's token
+alter table user_session enable row level security;
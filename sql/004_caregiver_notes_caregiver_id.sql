@@ -0,0 +1,3 @@
+-- caregivers load every plan they are assigned to through caregiver_notes
+create index if not exists caregiver_notes_caregiver_id_idx
+    on caregiver_notes (caregiver_id, care_plan_id);
@@ -0,0 +1,77 @@
+-- Per plan task and question metrics for the analytics page, so it doesn't
+-- have to download and parse every plan's json. Task and question
+-- updated_at are written in the app server's local time, plan timestamps
+-- are compared in the database's time zone.
+create materialized view if not exists care_plan_daily_metrics as
+select
+    cp.id as care_plan_id,
+    cp.guardian_id,
+    cp.patient_name,
+    cp.date,
+    coalesce(t.tasks_total, 0) as tasks_total,
+    coalesce(t.tasks_done, 0) as tasks_done,
+    coalesce(t.tasks_timed_done, 0) as tasks_timed_done,
+    coalesce(t.tasks_done_on_time, 0) as tasks_done_on_time,
+    coalesce(q.questions_total, 0) as questions_total,
+    coalesce(q.questions_answered, 0) as questions_answered,
+    coalesce(q.answer_secs_total, 0) as answer_secs_total
+from care_plan cp
+left join lateral (
+    select
+        count(*) as tasks_total,
+        count(*) filter (where (e ->> 'status')::boolean) as tasks_done,
+        count(*) filter (
+            where (e ->> 'status')::boolean and e ->> 'end_time' is not null
+        ) as tasks_timed_done,
+        count(*) filter (
+            where (e ->> 'status')::boolean
+              and e ->> 'end_time' is not null
+              and (e ->> 'updated_at')::timestamp
+                  <= cp.date + (e ->> 'end_time')::time
+        ) as tasks_done_on_time
+    from jsonb_array_elements(cp.tasks) e
+) t on true
+left join lateral (
+    select
+        count(*) as questions_total,
+        count(*) filter (where coalesce(e ->> 'answer', '') <> '')
+            as questions_answered,
+        sum(
+            greatest(
+                extract(epoch from (e ->> 'updated_at')::timestamp
+                    - cp.created_at::timestamp),
+                0
+            )
+        ) filter (where coalesce(e ->> 'answer', '') <> '') as answer_secs_total
+    from jsonb_array_elements(cp.questions) e
+) q on true;
+
+create unique index if not exists care_plan_daily_metrics_care_plan_id_idx
+    on care_plan_daily_metrics (care_plan_id);
+create index if not exists care_plan_daily_metrics_guardian_id_date_idx
+    on care_plan_daily_metrics (guardian_id, date);
+
+create or replace function refresh_care_plan_daily_metrics() returns void
+language sql security definer as $$
+    refresh materialized view concurrently care_plan_daily_metrics;
+$$;
+
+-- a refresh recomputes every plan, so app users can't start one: it runs
+-- hourly from pg_cron, which must be enabled
+revoke execute on function refresh_care_plan_daily_metrics()
+    from public, anon, authenticated;
+grant execute on function refresh_care_plan_daily_metrics() to service_role;
+
+do $$
+begin
+    if exists (select 1 from pg_extension where extname = 'pg_cron') then
+        perform cron.schedule(
+            'care_plan_daily_metrics', '0 * * * *',
+            'select refresh_care_plan_daily_metrics()'
+        );
+    else
+        raise warning 'pg_cron is not enabled, care_plan_daily_metrics '
+            'will only change when refresh_care_plan_daily_metrics() is run';
+    end if;
+end;
+$$;
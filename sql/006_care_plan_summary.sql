@@ -0,0 +1,105 @@
+-- One row per care plan (guardian, patient, date) with the counts the
+-- sidebar and reports need, kept up to date by triggers on every write so
+-- nothing has to scan and parse the plans' json to get them.
+create table if not exists care_plan_summary (
+    care_plan_id uuid primary key,
+    guardian_id uuid not null,
+    patient_name text not null,
+    date date not null,
+    task_count int not null default 0,
+    done_count int not null default 0,
+    unanswered_questions int not null default 0,
+    caregiver_count int not null default 0,
+    last_activity timestamptz not null default now()
+);
+
+create index if not exists care_plan_summary_guardian_id_date_idx
+    on care_plan_summary (guardian_id, date);
+
+create or replace function care_plan_summary_from_plan() returns trigger
+language plpgsql as $$
+begin
+    if tg_op = 'DELETE' then
+        delete from care_plan_summary where care_plan_id = old.id;
+        return old;
+    end if;
+    insert into care_plan_summary as s (
+        care_plan_id, guardian_id, patient_name, date,
+        task_count, done_count, unanswered_questions, last_activity
+    )
+    select
+        new.id, new.guardian_id, new.patient_name, new.date,
+        (select count(*) from jsonb_array_elements(new.tasks)),
+        (select count(*) from jsonb_array_elements(new.tasks) e
+            where (e ->> 'status')::boolean),
+        (select count(*) from jsonb_array_elements(new.questions) e
+            where coalesce(e ->> 'answer', '') = ''),
+        now()
+    on conflict (care_plan_id) do update set
+        guardian_id = excluded.guardian_id,
+        patient_name = excluded.patient_name,
+        date = excluded.date,
+        task_count = excluded.task_count,
+        done_count = excluded.done_count,
+        unanswered_questions = excluded.unanswered_questions,
+        last_activity = excluded.last_activity;
+    return new;
+end;
+$$;
+
+create or replace function care_plan_summary_from_caregivers() returns trigger
+language plpgsql as $$
+begin
+    update care_plan_summary set
+        caregiver_count = caregiver_count + case tg_op
+            when 'INSERT' then 1 when 'DELETE' then -1 else 0 end,
+        last_activity = now()
+    where care_plan_id = coalesce(new.care_plan_id, old.care_plan_id);
+    return coalesce(new, old);
+end;
+$$;
+
+create or replace function care_plan_summary_from_note() returns trigger
+language plpgsql as $$
+begin
+    update care_plan_summary set last_activity = new.created_at
+    where care_plan_id = new.care_plan_id;
+    return new;
+end;
+$$;
+
+drop trigger if exists care_plan_summary on care_plan;
+create trigger care_plan_summary
+    after insert or update of tasks, questions, patient_name, date or delete
+    on care_plan
+    for each row execute function care_plan_summary_from_plan();
+
+drop trigger if exists care_plan_summary on caregiver_notes;
+create trigger care_plan_summary
+    after insert or update of status or delete on caregiver_notes
+    for each row execute function care_plan_summary_from_caregivers();
+
+drop trigger if exists care_plan_summary on caregiver_note;
+create trigger care_plan_summary
+    after insert on caregiver_note
+    for each row execute function care_plan_summary_from_note();
+
+-- backfill
+insert into care_plan_summary (
+    care_plan_id, guardian_id, patient_name, date, task_count, done_count,
+    unanswered_questions, caregiver_count, last_activity
+)
+select
+    cp.id, cp.guardian_id, cp.patient_name, cp.date,
+    (select count(*) from jsonb_array_elements(cp.tasks)),
+    (select count(*) from jsonb_array_elements(cp.tasks) e
+        where (e ->> 'status')::boolean),
+    (select count(*) from jsonb_array_elements(cp.questions) e
+        where coalesce(e ->> 'answer', '') = ''),
+    (select count(*) from caregiver_notes cn where cn.care_plan_id = cp.id),
+    greatest(
+        cp.created_at,
+        (select max(n.created_at) from caregiver_note n where n.care_plan_id = cp.id)
+    )
+from care_plan cp
+on conflict (care_plan_id) do nothing;
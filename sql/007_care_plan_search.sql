@@ -0,0 +1,128 @@
+-- Full text search over task content, questions and answers and caregiver
+-- notes. Every item is a row with its own tsvector; triggers keep the rows
+-- in step with care_plan and caregiver_note writes.
+create table if not exists care_plan_search (
+    id bigint generated always as identity primary key,
+    care_plan_id uuid not null,
+    guardian_id uuid not null,
+    patient_name text not null,
+    date date not null,
+    kind text not null,
+    content text not null,
+    created_at timestamptz,
+    document tsvector generated always as (to_tsvector('english', content)) stored
+);
+
+create index if not exists care_plan_search_document_idx
+    on care_plan_search using gin (document);
+create index if not exists care_plan_search_care_plan_id_idx
+    on care_plan_search (care_plan_id);
+create index if not exists care_plan_search_guardian_id_idx
+    on care_plan_search (guardian_id);
+
+create or replace function care_plan_search_from_plan() returns trigger
+language plpgsql as $$
+begin
+    if tg_op = 'DELETE' then
+        delete from care_plan_search where care_plan_id = old.id;
+        return old;
+    end if;
+    delete from care_plan_search
+    where care_plan_id = new.id and kind in ('task', 'question', 'answer');
+    insert into care_plan_search (care_plan_id, guardian_id, patient_name, date, kind, content)
+    select new.id, new.guardian_id, new.patient_name, new.date, 'task', e ->> 'content'
+    from jsonb_array_elements(new.tasks) e
+    where coalesce(e ->> 'content', '') <> ''
+    union all
+    select new.id, new.guardian_id, new.patient_name, new.date, 'question', e ->> 'question'
+    from jsonb_array_elements(new.questions) e
+    where coalesce(e ->> 'question', '') <> ''
+    union all
+    select new.id, new.guardian_id, new.patient_name, new.date, 'answer',
+        (e ->> 'question') || ': ' || (e ->> 'answer')
+    from jsonb_array_elements(new.questions) e
+    where coalesce(e ->> 'answer', '') <> '';
+    if tg_op = 'UPDATE'
+        and (new.patient_name, new.date) is distinct from (old.patient_name, old.date)
+    then
+        update care_plan_search set patient_name = new.patient_name, date = new.date
+        where care_plan_id = new.id and kind = 'note';
+    end if;
+    return new;
+end;
+$$;
+
+create or replace function care_plan_search_from_note() returns trigger
+language plpgsql as $$
+begin
+    insert into care_plan_search (
+        care_plan_id, guardian_id, patient_name, date, kind, content, created_at
+    )
+    select cp.id, cp.guardian_id, cp.patient_name, cp.date, 'note',
+        coalesce(cn.name || ': ', '') || new.note, new.created_at
+    from care_plan cp
+    left join caregiver_notes cn
+        on cn.care_plan_id = cp.id and cn.caregiver_id = new.caregiver_id
+    where cp.id = new.care_plan_id;
+    return new;
+end;
+$$;
+
+drop trigger if exists care_plan_search on care_plan;
+create trigger care_plan_search
+    after insert or update of tasks, questions, patient_name, date or delete
+    on care_plan
+    for each row execute function care_plan_search_from_plan();
+
+drop trigger if exists care_plan_search on caregiver_note;
+create trigger care_plan_search
+    after insert on caregiver_note
+    for each row execute function care_plan_search_from_note();
+
+create or replace function search_care_plans(
+    p_guardian_id uuid, p_query text, p_limit int default 50
+) returns table (
+    care_plan_id uuid,
+    date date,
+    patient_name text,
+    kind text,
+    content text,
+    headline text,
+    created_at timestamptz,
+    rank real
+)
+language sql stable as $$
+    select s.care_plan_id, s.date, s.patient_name, s.kind, s.content,
+        ts_headline('english', s.content, q, 'StartSel=**, StopSel=**'),
+        s.created_at,
+        ts_rank(s.document, q)
+    from care_plan_search s, websearch_to_tsquery('english', p_query) q
+    where s.guardian_id = p_guardian_id and s.document @@ q
+    order by s.date desc, ts_rank(s.document, q) desc
+    limit p_limit;
+$$;
+
+-- backfill
+insert into care_plan_search (care_plan_id, guardian_id, patient_name, date, kind, content)
+select cp.id, cp.guardian_id, cp.patient_name, cp.date, 'task', e ->> 'content'
+from care_plan cp, jsonb_array_elements(cp.tasks) e
+where coalesce(e ->> 'content', '') <> ''
+union all
+select cp.id, cp.guardian_id, cp.patient_name, cp.date, 'question', e ->> 'question'
+from care_plan cp, jsonb_array_elements(cp.questions) e
+where coalesce(e ->> 'question', '') <> ''
+union all
+select cp.id, cp.guardian_id, cp.patient_name, cp.date, 'answer',
+    (e ->> 'question') || ': ' || (e ->> 'answer')
+from care_plan cp, jsonb_array_elements(cp.questions) e
+where coalesce(e ->> 'answer', '') <> '';
+
+insert into care_plan_search (
+    care_plan_id, guardian_id, patient_name, date, kind, content, created_at
+)
+select cp.id, cp.guardian_id, cp.patient_name, cp.date, 'note',
+    coalesce(cn.name || ': ', '') || n.note, n.created_at
+from caregiver_note n
+join care_plan cp on cp.id = n.care_plan_id
+left join caregiver_notes cn
+    on cn.care_plan_id = n.care_plan_id and cn.caregiver_id = n.caregiver_id;
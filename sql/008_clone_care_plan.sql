@@ -0,0 +1,47 @@
+-- Copies a plan's tasks and questions into a new plan for each of p_dates,
+-- without the app downloading and re-uploading them. Tasks come back not
+-- done and questions unanswered. p_updated_at is passed by the app since
+-- task and question updated_at are in the app server's local time.
+create or replace function clone_care_plan(
+    p_source_id uuid, p_dates date[], p_updated_at timestamp default localtimestamp
+) returns setof uuid
+language sql as $$
+    insert into care_plan (guardian_id, date, patient_name, tasks, questions)
+    select cp.guardian_id, d, cp.patient_name,
+        coalesce(
+            (
+                select jsonb_agg(
+                    jsonb_build_object(
+                        'content', e -> 'content',
+                        'start_time', e -> 'start_time',
+                        'end_time', e -> 'end_time',
+                        'status', false,
+                        'updated_at', p_updated_at,
+                        'audio_key', null
+                    )
+                    order by i
+                )
+                from jsonb_array_elements(cp.tasks) with ordinality t(e, i)
+            ),
+            '[]'::jsonb
+        ),
+        coalesce(
+            (
+                select jsonb_agg(
+                    jsonb_build_object(
+                        'question', e -> 'question',
+                        'answer', '',
+                        'updated_at', p_updated_at,
+                        'audio_key', null
+                    )
+                    order by i
+                )
+                from jsonb_array_elements(cp.questions) with ordinality q(e, i)
+            ),
+            '[]'::jsonb
+        )
+    from care_plan cp, unnest(p_dates) d
+    where cp.id = p_source_id
+    order by d
+    returning id;
+$$;
@@ -0,0 +1,244 @@
+-- Plans older than a cutoff move out of the hot care_plan, caregiver_notes
+-- and caregiver_note tables, which every poll reads, into care_plan_archive.
+-- Their caregivers and notes are kept as json snapshots, past plans are
+-- read only. Summary and search rows stay, so the sidebar and search still
+-- list archived plans; DBClient reads the archive when a plan isn't hot.
+create table if not exists care_plan_archive (
+    id uuid primary key,
+    guardian_id uuid not null,
+    date date not null,
+    patient_name text not null,
+    created_at timestamptz not null,
+    tasks jsonb not null default '[]',
+    questions jsonb not null default '[]',
+    -- caregiver_notes rows: caregiver_id, name, status
+    caregivers jsonb not null default '[]',
+    -- caregiver_note rows in created_at order
+    notes jsonb not null default '[]',
+    archived_at timestamptz not null default now()
+);
+
+create index if not exists care_plan_archive_guardian_id_date_idx
+    on care_plan_archive (guardian_id, date);
+create index if not exists care_plan_archive_caregivers_idx
+    on care_plan_archive using gin (caregivers jsonb_path_ops);
+
+create or replace function archive_care_plans(p_days int) returns int
+language plpgsql security definer as $$
+declare
+    ids uuid[];
+begin
+    if p_days is null or p_days < 1 then
+        raise exception 'archive_care_plans: p_days must be at least 1, got %',
+            p_days;
+    end if;
+    ids := array(select id from care_plan where date < current_date - p_days);
+    if cardinality(ids) = 0 then
+        return 0;
+    end if;
+    insert into care_plan_archive (
+        id, guardian_id, date, patient_name, created_at, tasks, questions,
+        caregivers, notes
+    )
+    select
+        cp.id, cp.guardian_id, cp.date, cp.patient_name, cp.created_at,
+        cp.tasks, cp.questions,
+        coalesce(
+            (
+                select jsonb_agg(
+                    jsonb_build_object(
+                        'caregiver_id', cn.caregiver_id,
+                        'name', cn.name,
+                        'status', cn.status
+                    )
+                    order by cn.caregiver_id
+                )
+                from caregiver_notes cn
+                where cn.care_plan_id = cp.id
+            ),
+            '[]'::jsonb
+        ),
+        coalesce(
+            (
+                select jsonb_agg(
+                    jsonb_build_object(
+                        'caregiver_id', n.caregiver_id,
+                        'note', n.note,
+                        'created_at', n.created_at,
+                        'audio_key', n.audio_key
+                    )
+                    order by n.created_at
+                )
+                from caregiver_note n
+                where n.care_plan_id = cp.id
+            ),
+            '[]'::jsonb
+        )
+    from care_plan cp
+    where cp.id = any(ids)
+    on conflict (id) do nothing;
+
+    -- tells the summary and search triggers to keep the rows of these plans
+    perform set_config('relait.archiving', 'on', true);
+    delete from caregiver_note where care_plan_id = any(ids);
+    delete from caregiver_notes where care_plan_id = any(ids);
+    delete from care_plan where id = any(ids);
+    perform set_config('relait.archiving', 'off', true);
+    return cardinality(ids);
+end;
+$$;
+
+-- runs as its owner, so only the nightly job may call it
+revoke execute on function archive_care_plans(int)
+    from public, anon, authenticated;
+grant execute on function archive_care_plans(int) to service_role;
+
+-- plans can be copied from archived ones too, which are still listed since
+-- their summary rows are kept
+create or replace function clone_care_plan(
+    p_source_id uuid, p_dates date[], p_updated_at timestamp default localtimestamp
+) returns setof uuid
+language sql as $$
+    insert into care_plan (guardian_id, date, patient_name, tasks, questions)
+    select cp.guardian_id, d, cp.patient_name,
+        coalesce(
+            (
+                select jsonb_agg(
+                    jsonb_build_object(
+                        'content', e -> 'content',
+                        'start_time', e -> 'start_time',
+                        'end_time', e -> 'end_time',
+                        'status', false,
+                        'updated_at', p_updated_at,
+                        'audio_key', null
+                    )
+                    order by i
+                )
+                from jsonb_array_elements(cp.tasks) with ordinality t(e, i)
+            ),
+            '[]'::jsonb
+        ),
+        coalesce(
+            (
+                select jsonb_agg(
+                    jsonb_build_object(
+                        'question', e -> 'question',
+                        'answer', '',
+                        'updated_at', p_updated_at,
+                        'audio_key', null
+                    )
+                    order by i
+                )
+                from jsonb_array_elements(cp.questions) with ordinality q(e, i)
+            ),
+            '[]'::jsonb
+        )
+    from (
+        select id, guardian_id, patient_name, tasks, questions from care_plan
+        union all
+        select id, guardian_id, patient_name, tasks, questions
+        from care_plan_archive
+    ) cp, unnest(p_dates) d
+    where cp.id = p_source_id
+    order by d
+    returning id;
+$$;
+
+-- deletes fire the summary and search triggers separately, so that they can
+-- skip the deletes made by archive_care_plans
+drop trigger if exists care_plan_summary on care_plan;
+drop trigger if exists care_plan_summary_delete on care_plan;
+create trigger care_plan_summary
+    after insert or update of tasks, questions, patient_name, date
+    on care_plan
+    for each row execute function care_plan_summary_from_plan();
+create trigger care_plan_summary_delete
+    after delete on care_plan
+    for each row
+    when (current_setting('relait.archiving', true) is distinct from 'on')
+    execute function care_plan_summary_from_plan();
+
+drop trigger if exists care_plan_summary on caregiver_notes;
+drop trigger if exists care_plan_summary_delete on caregiver_notes;
+create trigger care_plan_summary
+    after insert or update of status on caregiver_notes
+    for each row execute function care_plan_summary_from_caregivers();
+create trigger care_plan_summary_delete
+    after delete on caregiver_notes
+    for each row
+    when (current_setting('relait.archiving', true) is distinct from 'on')
+    execute function care_plan_summary_from_caregivers();
+
+drop trigger if exists care_plan_search on care_plan;
+drop trigger if exists care_plan_search_delete on care_plan;
+create trigger care_plan_search
+    after insert or update of tasks, questions, patient_name, date
+    on care_plan
+    for each row execute function care_plan_search_from_plan();
+create trigger care_plan_search_delete
+    after delete on care_plan
+    for each row
+    when (current_setting('relait.archiving', true) is distinct from 'on')
+    execute function care_plan_search_from_plan();
+
+-- analytics cover archived plans too
+drop materialized view if exists care_plan_daily_metrics;
+create materialized view care_plan_daily_metrics as
+select
+    cp.id as care_plan_id,
+    cp.guardian_id,
+    cp.patient_name,
+    cp.date,
+    coalesce(t.tasks_total, 0) as tasks_total,
+    coalesce(t.tasks_done, 0) as tasks_done,
+    coalesce(t.tasks_timed_done, 0) as tasks_timed_done,
+    coalesce(t.tasks_done_on_time, 0) as tasks_done_on_time,
+    coalesce(q.questions_total, 0) as questions_total,
+    coalesce(q.questions_answered, 0) as questions_answered,
+    coalesce(q.answer_secs_total, 0) as answer_secs_total
+from (
+    select id, guardian_id, patient_name, date, created_at, tasks, questions
+    from care_plan
+    union all
+    select id, guardian_id, patient_name, date, created_at, tasks, questions
+    from care_plan_archive
+) cp
+left join lateral (
+    select
+        count(*) as tasks_total,
+        count(*) filter (where (e ->> 'status')::boolean) as tasks_done,
+        count(*) filter (
+            where (e ->> 'status')::boolean and e ->> 'end_time' is not null
+        ) as tasks_timed_done,
+        count(*) filter (
+            where (e ->> 'status')::boolean
+              and e ->> 'end_time' is not null
+              and (e ->> 'updated_at')::timestamp
+                  <= cp.date + (e ->> 'end_time')::time
+        ) as tasks_done_on_time
+    from jsonb_array_elements(cp.tasks) e
+) t on true
+left join lateral (
+    select
+        count(*) as questions_total,
+        count(*) filter (where coalesce(e ->> 'answer', '') <> '')
+            as questions_answered,
+        sum(
+            greatest(
+                extract(epoch from (e ->> 'updated_at')::timestamp
+                    - cp.created_at::timestamp),
+                0
+            )
+        ) filter (where coalesce(e ->> 'answer', '') <> '') as answer_secs_total
+    from jsonb_array_elements(cp.questions) e
+) q on true;
+
+create unique index if not exists care_plan_daily_metrics_care_plan_id_idx
+    on care_plan_daily_metrics (care_plan_id);
+create index if not exists care_plan_daily_metrics_guardian_id_date_idx
+    on care_plan_daily_metrics (guardian_id, date);
+
+-- with pg_cron enabled, archive nightly. Keep the days in sync with
+-- ARCHIVE_AFTER_DAYS in store.py:
+-- select cron.schedule('archive_care_plans', '30 3 * * *',
+--     'select archive_care_plans(90)');
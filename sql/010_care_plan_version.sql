@@ -0,0 +1,18 @@
+-- A counter bumped by every write of a plan's tasks or questions. The app's
+-- write-behind buffer only writes a plan still at the version its copy was
+-- loaded at, so an edit made on a stale copy is rejected instead of
+-- overwriting the tasks and questions someone else saved meanwhile.
+alter table care_plan add column if not exists version bigint not null default 0;
+
+create or replace function care_plan_bump_version() returns trigger
+language plpgsql as $$
+begin
+    new.version := old.version + 1;
+    return new;
+end;
+$$;
+
+drop trigger if exists care_plan_version on care_plan;
+create trigger care_plan_version
+    before update of tasks, questions on care_plan
+    for each row execute function care_plan_bump_version();
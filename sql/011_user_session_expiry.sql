@@ -0,0 +1,12 @@
+-- Sessions lapse with their cookie, keep the interval in sync with
+-- SESSION_MAX_AGE_SECS in main.py. DBClient ignores lapsed rows and deletes
+-- a user's lapsed rows when they sign in again.
+alter table user_session add column if not exists session_expires_at timestamptz
+    not null default now() + interval '30 days';
+
+create index if not exists user_session_session_expires_at_idx
+    on user_session (session_expires_at);
+
+-- with pg_cron enabled, also clear out the rows of users who never return:
+-- select cron.schedule('delete_expired_user_sessions', '0 4 * * *',
+--     'delete from user_session where session_expires_at < now()');
@@ -0,0 +1,8 @@
+-- Caregivers are looked up by email case-insensitively: one stored as
+-- Alice@example.com and invited again as alice@example.com is the same
+-- caregiver, not a new one to invite twice.
+alter table guardian_caregiver add column if not exists caregiver_email_lower text
+    generated always as (lower(caregiver_email)) stored;
+
+create index if not exists guardian_caregiver_guardian_id_email_lower_idx
+    on guardian_caregiver (guardian_id, caregiver_email_lower);
@@ -1,8 +1,15 @@
-from supabase import create_client, Client
 from enum import Enum
-from datetime import date, datetime, time
+from datetime import date, datetime, time, timedelta
 from dataclasses import dataclass, field
-from utils import now_time
+from functools import cached_property, lru_cache
+from bisect import insort
+import heapq
+from typing import Callable, Iterator
+from shared_cache import SharedCache
+
+# task times are snapped to 30 minute slots, so the same few strings repeat
+# across every plan
+parse_time = lru_cache(maxsize=4096)(time.fromisoformat)
 
 
 class Role(Enum):
@@ -15,23 +22,27 @@ class Caregiver_Status(Enum):
     ACCEPTED = "ACCEPTED"
 
 
-@dataclass
+@dataclass(slots=True)
 class CaregiverNote:
     note: str
-    created_at: time = field(default_factory=now_time)
-
-    def serialize_to_db(self) -> dict:
-        return {
-            "note": self.note,
-            "created_at": self.created_at.isoformat(),
-        }
+    created_at: datetime
+    caregiver_id: str
+    audio_key: str | None = None
+    # caregiver_note identity, grows with every insert; archived notes have none
+    id: int | None = None
 
     @staticmethod
     def deserialize_from_db(note: dict):
-        return CaregiverNote(note["note"], time.fromisoformat(note["created_at"]))
+        return CaregiverNote(
+            note["note"],
+            datetime.fromisoformat(note["created_at"]).astimezone(),
+            note["caregiver_id"],
+            note.get("audio_key"),
+            note.get("id"),
+        )
 
 
-@dataclass
+@dataclass(slots=True)
 class Caregiver:
     id: str
     name: str
@@ -39,26 +50,29 @@ class Caregiver:
     notes: list[CaregiverNote] = field(default_factory=list)
 
     @staticmethod
-    def deserialize_from_db(caregiver: dict):
+    def deserialize_from_db(caregiver: dict, notes: list[CaregiverNote] = []):
         return Caregiver(
             caregiver["caregiver_id"],
             caregiver["name"],
             Caregiver_Status(caregiver["status"]),
-            [CaregiverNote.deserialize_from_db(note) for note in caregiver["notes"]],
+            list(notes),
         )
 
 
-@dataclass
+@dataclass(slots=True)
 class Question:
     question: str
     answer: str = ""
     updated_at: datetime = field(default_factory=datetime.now)
+    # recording the question or its answer was transcribed from
+    audio_key: str | None = None
 
     def serialize_to_db(self) -> dict:
         return {
             "question": self.question,
             "answer": self.answer,
             "updated_at": self.updated_at.isoformat(),
+            "audio_key": self.audio_key,
         }
 
     @staticmethod
@@ -67,22 +81,26 @@ class Question:
             question["question"],
             question["answer"],
             datetime.fromisoformat(question["updated_at"]),
+            question.get("audio_key"),
         )
 
 
-@dataclass
+@dataclass(slots=True)
 class Task:
     content: str
     start_time: time | None = None
     end_time: time | None = None
     status: bool = False
     updated_at: datetime = field(default_factory=datetime.now)
+    # recording the task was transcribed from
+    audio_key: str | None = None
 
     def serialize_to_db(self, serialize_time: bool = True) -> dict:
         return {
             "content": self.content,
             "status": self.status,
             "updated_at": self.updated_at.isoformat(),
+            "audio_key": self.audio_key,
             "start_time": (
                 self.start_time.isoformat()
                 if self.start_time and serialize_time
@@ -99,16 +117,15 @@ class Task:
     def deserialize_from_db(task: dict):
         return Task(
             content=task["content"],
-            start_time=(
-                time.fromisoformat(task["start_time"]) if task["start_time"] else None
-            ),
-            end_time=time.fromisoformat(task["end_time"]) if task["end_time"] else None,
+            start_time=parse_time(task["start_time"]) if task["start_time"] else None,
+            end_time=parse_time(task["end_time"]) if task["end_time"] else None,
             status=task["status"],
             updated_at=datetime.fromisoformat(task["updated_at"]),
+            audio_key=task.get("audio_key"),
         )
 
 
-@dataclass
+@dataclass(slots=True)
 class CarePlan:
     id: str
     guardian_id: str
@@ -118,14 +135,69 @@ class CarePlan:
     caregivers: list[Caregiver] = field(default_factory=list)
     questions: list[Question] = field(default_factory=list)
     tasks: list[Task] = field(default_factory=list)
+    # bumped by the database on every write of tasks or questions (sql/010)
+    version: int = 0
+    # notes of all caregivers merged by created_at, paired with the caregiver name
+    _timeline: list[tuple[CaregiverNote, str]] = field(
+        init=False, default_factory=list, repr=False, compare=False
+    )
+    # highest note id fetched from the server. Only fetches move it: notes
+    # this session writes itself can be newer than notes of other caregivers
+    # it hasn't fetched yet
+    notes_cursor: int | None = field(
+        init=False, default=None, repr=False, compare=False
+    )
 
-    @property
-    def caregiver_notes(self) -> list[CaregiverNote]:
-        return sorted(
-            [[n, cg.name] for cg in self.caregivers for n in cg.notes],
-            key=lambda x: x[0].created_at,
+    def __post_init__(self):
+        self._merge_notes()
+        # the notes a plan is made with are all fetched
+        self.notes_cursor = max(
+            (n.id for n, _ in self._timeline if n.id is not None), default=None
         )
 
+    def _merge_notes(self):
+        # each caregiver's notes are already ordered by created_at
+        self._timeline = list(
+            heapq.merge(
+                *([(n, cg.name) for n in cg.notes] for cg in self.caregivers),
+                key=lambda x: x[0].created_at,
+            )
+        )
+
+    @property
+    def caregiver_notes(self) -> list[tuple[CaregiverNote, str]]:
+        return self._timeline
+
+    def add_notes(self, notes: list[CaregiverNote]):
+        """Notes this session wrote, they don't move notes_cursor."""
+        caregivers = {cg.id: cg for cg in self.caregivers}
+        for n in notes:
+            cg = caregivers.get(n.caregiver_id)
+            if not cg:
+                continue
+            insort(cg.notes, n, key=lambda x: x.created_at)
+            if self._timeline and n.created_at < self._timeline[-1][0].created_at:
+                insort(self._timeline, (n, cg.name), key=lambda x: x[0].created_at)
+            else:
+                self._timeline.append((n, cg.name))
+
+    def add_fetched_notes(self, notes: list[CaregiverNote]):
+        """Notes fetched with get_caregiver_notes(since=notes_cursor), the ones
+        this session wrote and already added are skipped."""
+        if not notes:
+            return
+        cursor = self.notes_cursor or 0
+        added = {n.id for n, _ in self._timeline if n.id and n.id > cursor}
+        self.add_notes([n for n in notes if n.id not in added])
+        self.notes_cursor = max(cursor, *(n.id for n in notes))
+
+    def take_notes(self, other: "CarePlan"):
+        notes = {cg.id: cg.notes for cg in other.caregivers}
+        for cg in self.caregivers:
+            cg.notes = notes.get(cg.id, cg.notes)
+        self._merge_notes()
+        self.notes_cursor = other.notes_cursor
+
     @staticmethod
     def deserialize_from_db(cp: dict, caregivers: list[Caregiver]):
         return CarePlan(
@@ -137,46 +209,186 @@ class CarePlan:
             tasks=[Task.deserialize_from_db(task) for task in cp["tasks"]],
             questions=[Question.deserialize_from_db(q) for q in cp["questions"]],
             caregivers=caregivers,
+            version=cp.get("version", 0),
+        )
+
+
+USER_CACHE_TTL_SECS = 60.0
+# plans dated longer ago than this are moved to care_plan_archive by
+# archive_care_plans (sql/009), which is scheduled with the same days
+ARCHIVE_AFTER_DAYS = 90
+ARCHIVE_COLUMNS = "id, guardian_id, date, patient_name, created_at, tasks, questions"
+
+
+def archive_cutoff() -> date:
+    """Plans dated before this may be archived."""
+    return date.today() - timedelta(days=ARCHIVE_AFTER_DAYS)
+
+
+def deserialize_archived_care_plan(cp: dict) -> CarePlan:
+    notes: dict[str, list[CaregiverNote]] = {}
+    for n in cp.get("notes", []):
+        notes.setdefault(n["caregiver_id"], []).append(
+            CaregiverNote.deserialize_from_db(n)
         )
+    return CarePlan.deserialize_from_db(
+        cp,
+        [
+            Caregiver.deserialize_from_db(cg, notes.get(cg["caregiver_id"], []))
+            for cg in cp["caregivers"]
+        ],
+    )
 
 
 class DBClient:
-    def __init__(self, supabase_url: str, supabase_key: str) -> Client:
+    def __init__(
+        self, supabase_url: str, supabase_key: str, cache: SharedCache | None = None
+    ):
+        # supabase is only needed once a client is made, importers that just
+        # use the models (export, bench) don't pay for it
+        from supabase import create_client
+
         self.client = create_client(supabase_url, supabase_key)
+        self.supabase_url = supabase_url
+        self.supabase_key = supabase_key
+        self.cache = cache
+        # called with the plan id and, for task and question writes, the
+        # serialized update once a care plan write succeeded
+        self.listeners: list[Callable[[str, dict | None], None]] = []
+
+    @cached_property
+    def service_client(self):
+        # sign_in and refresh_session switch self.client to the user's token,
+        # user_session rows are only readable by the service role, so they go
+        # through a client that never signs in
+        from supabase import create_client
+
+        return create_client(self.supabase_url, self.supabase_key)
+
+    def _after_write(self, care_plan_id: str, update: dict | None = None):
+        for listener in self.listeners:
+            listener(care_plan_id, update)
+
+    # invalidations come after their write: a read that starts before the
+    # write commits then fails SharedCache's version check instead of storing
+    # the old data under the new version
+    def _invalidate_care_plan(self, care_plan_id: str | None = None):
+        if self.cache:
+            self.cache.invalidate(f"care_plan:{care_plan_id or ''}")
+
+    def _invalidate_user(self, user_id: str):
+        if self.cache:
+            self.cache.invalidate(f"user:{user_id}")
 
     def sign_in(self, email: str, password: str):
         return self.client.auth.sign_in_with_password(
             {"email": email, "password": password}
-        ).user
+        )
+
+    def refresh_session(self, refresh_token: str):
+        return self.client.auth.refresh_session(refresh_token)
+
+    def create_user_session(
+        self, user_id: str, access_token: str, refresh_token: str, expires_at: int
+    ) -> dict:
+        # each sign-in adds a row, clear out the user's lapsed ones
+        self.service_client.table("user_session").delete().eq("user_id", user_id).lt(
+            "session_expires_at", datetime.now().astimezone().isoformat()
+        ).execute()
+        return (
+            self.service_client.table("user_session")
+            .insert(
+                {
+                    "user_id": user_id,
+                    "access_token": access_token,
+                    "refresh_token": refresh_token,
+                    "expires_at": expires_at,
+                }
+            )
+            .execute()
+            .data[0]
+        )
+
+    def get_user_session(self, session_id: str) -> dict | None:
+        data = (
+            self.service_client.table("user_session")
+            .select("*")
+            .eq("id", session_id)
+            .gt("session_expires_at", datetime.now().astimezone().isoformat())
+            .execute()
+            .data
+        )
+        return data[0] if data else None
+
+    def update_user_session(
+        self, session_id: str, access_token: str, refresh_token: str, expires_at: int
+    ):
+        self.service_client.table("user_session").update(
+            {
+                "access_token": access_token,
+                "refresh_token": refresh_token,
+                "expires_at": expires_at,
+                "updated_at": datetime.now().astimezone().isoformat(),
+            }
+        ).eq("id", session_id).execute()
+
+    def delete_user_session(self, session_id: str):
+        self.service_client.table("user_session").delete().eq(
+            "id", session_id
+        ).execute()
 
     def get_user(
         self, user_id: str | None = None, jwt: str | None = None
     ) -> dict | None:
         if user_id:
-            try:
-                return self.client.auth.admin.get_user_by_id(user_id).user
-            except:
-                return None
+            if self.cache:
+                return self.cache.get(
+                    f"user:{user_id}",
+                    lambda: self._get_user_by_id(user_id),
+                    USER_CACHE_TTL_SECS,
+                )
+            return self._get_user_by_id(user_id)
         else:
             return self.client.auth.get_user(jwt).user
 
+    def _get_user_by_id(self, user_id: str) -> dict | None:
+        try:
+            return self.client.auth.admin.get_user_by_id(user_id).user
+        except:
+            return None
+
     def get_caregiver_user(self, email: str) -> dict | None:
-        response = self.client.auth.admin.list_users()
-        for user in response:
-            if (
-                user.email == email
-                and user.user_metadata["role"] == Role.CAREGIVER.value
-            ):
-                return user
-        return None
+        return self.get_caregiver_users([email]).get(email)
+
+    def get_caregiver_users(self, emails: list[str]) -> dict[str, dict]:
+        return self.get_users(emails, Role.CAREGIVER)
+
+    def get_users(self, emails: list[str], role: Role | None = None) -> dict[str, dict]:
+        emails = set(emails)
+        users = {}
+        page = 1
+        while len(users) < len(emails):
+            response = self.client.auth.admin.list_users(page=page, per_page=1000)
+            if not response:
+                break
+            for user in response:
+                if user.email in emails and (
+                    role is None or user.user_metadata.get("role") == role.value
+                ):
+                    users[user.email] = user
+            page += 1
+        return users
 
     def update_user_password(self, user_id: str, password: str):
-        return self.client.auth.admin.update_user_by_id(
+        user = self.client.auth.admin.update_user_by_id(
             user_id, {"password": password}
         ).user
+        self._invalidate_user(user_id)
+        return user
 
     def update_user_metadata(self, user_id: str, metadata: dict):
         self.client.auth.admin.update_user_by_id(user_id, {"user_metadata": metadata})
+        self._invalidate_user(user_id)
 
     def invite_user_by_email(self, email: str, first_name: str, last_name: str) -> dict:
         return self.client.auth.admin.invite_user_by_email(
@@ -194,7 +406,6 @@ class DBClient:
         self,
         email: str,
         redirect_url: str,
-        care_plan_id: str | None = None,
         first_name: str | None = None,
         last_name: str | None = None,
     ):
@@ -204,7 +415,6 @@ class DBClient:
                 "first_name": first_name,
                 "last_name": last_name,
                 "role": Role.CAREGIVER.value,
-                "care_plan_id": care_plan_id,
             }
         self.client.auth.sign_in_with_otp({"email": email, "options": options})
 
@@ -230,10 +440,35 @@ class DBClient:
             .execute()
             .data[0]
         )
+        self._after_write(cp["id"])
         return CarePlan.deserialize_from_db(cp, [])
 
+    def clone_care_plan(self, source_id: str, dates: list[date]) -> list[str]:
+        """New plans copied from source_id, one per date, tasks not done and
+        questions unanswered. Returns their ids in date order."""
+        ids = (
+            self.client.rpc(
+                "clone_care_plan",
+                {
+                    "p_source_id": source_id,
+                    "p_dates": [d.isoformat() for d in dates],
+                    "p_updated_at": datetime.now().isoformat(),
+                },
+            )
+            .execute()
+            .data
+        )
+        for id in ids:
+            self._after_write(id)
+        return ids
+
     def delete_care_plan(self, care_plan_id: str):
-        return self.client.table("care_plan").delete().eq("id", care_plan_id).execute()
+        deleted = (
+            self.client.table("care_plan").delete().eq("id", care_plan_id).execute()
+        )
+        self._invalidate_care_plan(care_plan_id)
+        self._after_write(care_plan_id)
+        return deleted
 
     def create_caregiver_in_care_plan(
         self, caregiver_id: str, care_plan_id: str, name: str
@@ -255,6 +490,36 @@ class DBClient:
                     "status": Caregiver_Status.INVITED.value,
                 }
             ).execute()
+            self._invalidate_care_plan(care_plan_id)
+            self._after_write(care_plan_id)
+
+    def create_caregivers_in_care_plan(
+        self, care_plan_id: str, caregivers: list[tuple[str, str]]
+    ):
+        """caregivers are (caregiver_id, name) pairs not yet in the care plan"""
+        if not caregivers:
+            return
+        self.client.table("caregiver_notes").insert(
+            [
+                {
+                    "caregiver_id": caregiver_id,
+                    "care_plan_id": care_plan_id,
+                    "name": name,
+                    "status": Caregiver_Status.INVITED.value,
+                }
+                for caregiver_id, name in caregivers
+            ]
+        ).execute()
+        self._invalidate_care_plan(care_plan_id)
+        self._after_write(care_plan_id)
+
+    def create_guardian_caregivers(self, guardian_id: str, caregivers: list[dict]):
+        """caregivers are guardian_caregiver rows without the guardian_id"""
+        if not caregivers:
+            return
+        self.client.table("guardian_caregiver").insert(
+            [{"guardian_id": guardian_id, **cg} for cg in caregivers]
+        ).execute()
 
     def create_guardian_caregiver(
         self,
@@ -278,13 +543,64 @@ class DBClient:
         self.client.table("caregiver_notes").update({"status": status.value}).eq(
             "care_plan_id", care_plan_id
         ).eq("caregiver_id", caregiver_id).execute()
+        self._invalidate_care_plan(care_plan_id)
 
-    def update_caregiver_notes(
-        self, care_plan_id: str, caregiver_id: str, notes: list[CaregiverNote]
-    ):
+    def accept_caregiver_invitations(self, caregiver_id: str):
         self.client.table("caregiver_notes").update(
-            {"notes": [n.serialize_to_db() for n in notes]}
-        ).eq("care_plan_id", care_plan_id).eq("caregiver_id", caregiver_id).execute()
+            {"status": Caregiver_Status.ACCEPTED.value}
+        ).eq("caregiver_id", caregiver_id).eq(
+            "status", Caregiver_Status.INVITED.value
+        ).execute()
+        self._invalidate_care_plan()
+
+    def add_caregiver_note(
+        self,
+        care_plan_id: str,
+        caregiver_id: str,
+        note: str,
+        audio_key: str | None = None,
+    ) -> CaregiverNote:
+        created = (
+            self.client.table("caregiver_note")
+            .insert(
+                {
+                    "care_plan_id": care_plan_id,
+                    "caregiver_id": caregiver_id,
+                    "note": note,
+                    "audio_key": audio_key,
+                }
+            )
+            .execute()
+            .data[0]
+        )
+        self._invalidate_care_plan(care_plan_id)
+        return CaregiverNote.deserialize_from_db(created)
+
+    def set_caregiver_note_audio_key(
+        self, care_plan_id: str, note_id: int, audio_key: str
+    ):
+        self.client.table("caregiver_note").update(
+            {"audio_key": audio_key}, returning="minimal"
+        ).eq("id", note_id).execute()
+        self._invalidate_care_plan(care_plan_id)
+
+    def get_caregiver_notes(
+        self, care_plan_id: str, since: int | None = None
+    ) -> list[CaregiverNote]:
+        """Notes of the plan with an id above since, in id order. created_at is
+        now() at the start of the inserting transaction and can land behind
+        notes already fetched, ids are handed out in insert order."""
+        q = (
+            self.client.table("caregiver_note")
+            .select("id, caregiver_id, note, created_at, audio_key")
+            .eq("care_plan_id", care_plan_id)
+        )
+        if since is not None:
+            q = q.gt("id", since)
+        return [
+            CaregiverNote.deserialize_from_db(n)
+            for n in q.order("id").execute().data
+        ]
 
     def update_care_plan(
         self,
@@ -307,13 +623,33 @@ class DBClient:
             .execute()
             .data[0]
         )
+        self._invalidate_care_plan(care_plan_id)
+        self._after_write(care_plan_id, update)
         return CarePlan.deserialize_from_db(updated, self.get_caregivers(updated["id"]))
 
+    def write_care_plan(self, care_plan_id: str, update: dict, version: int) -> bool:
+        """Write already serialized tasks and/or questions without reading back.
+        Only written if the plan is still at version, returns whether it was."""
+        written = (
+            self.client.table("care_plan")
+            .update(update, count="exact", returning="minimal")
+            .eq("id", care_plan_id)
+            .eq("version", version)
+            .execute()
+            .count
+        )
+        if not written:
+            return False
+        self._invalidate_care_plan(care_plan_id)
+        self._after_write(care_plan_id, update)
+        return True
+
     def get_caregivers_for_guardian(
         self,
         guardian_id: str,
         caregiver_id: str | None = None,
         caregiver_email: str | None = None,
+        caregiver_emails: list[str] | None = None,
     ) -> list[dict]:
         q = (
             self.client.table("guardian_caregiver")
@@ -322,8 +658,11 @@ class DBClient:
         )
         if caregiver_id:
             q = q.eq("caregiver_id", caregiver_id)
+        # stored emails may differ from the ones asked for in case (sql/012)
         elif caregiver_email:
-            q = q.eq("caregiver_email", caregiver_email)
+            q = q.eq("caregiver_email_lower", caregiver_email.lower())
+        elif caregiver_emails:
+            q = q.in_("caregiver_email_lower", [e.lower() for e in caregiver_emails])
         return q.execute().data
         """
         data = (
@@ -346,26 +685,61 @@ class DBClient:
         """
 
     def get_caregivers(
-        self, care_plan_id: str, caregiver_id: str | None = None
+        self,
+        care_plan_id: str,
+        caregiver_id: str | None = None,
+        with_notes: bool = True,
     ) -> list[Caregiver]:
+        return self.get_caregivers_for_care_plans(
+            [care_plan_id], caregiver_id, with_notes
+        ).get(care_plan_id, [])
+
+    def get_caregivers_for_care_plans(
+        self,
+        care_plan_ids: list[str],
+        caregiver_id: str | None = None,
+        with_notes: bool = True,
+    ) -> dict[str, list[Caregiver]]:
+        if not care_plan_ids:
+            return {}
+        q = (
+            self.client.table("caregiver_notes")
+            .select("care_plan_id, caregiver_id, name, status")
+            .in_("care_plan_id", care_plan_ids)
+        )
         if caregiver_id:
-            cgs = (
-                self.client.table("caregiver_notes")
-                .select("*")
-                .eq("care_plan_id", care_plan_id)
-                .eq("caregiver_id", caregiver_id)
-                .execute()
-                .data
-            )
-        else:
-            cgs = (
-                self.client.table("caregiver_notes")
-                .select("*")
-                .eq("care_plan_id", care_plan_id)
-                .execute()
-                .data
+            q = q.eq("caregiver_id", caregiver_id)
+        cgs = q.execute().data
+
+        notes: dict[tuple[str, str], list[CaregiverNote]] = {}
+        if with_notes and cgs:
+
+            def notes_query():
+                q = (
+                    self.client.table("caregiver_note")
+                    .select(
+                        "id, care_plan_id, caregiver_id, note, created_at, audio_key"
+                    )
+                    .in_("care_plan_id", care_plan_ids)
+                )
+                if caregiver_id:
+                    q = q.eq("caregiver_id", caregiver_id)
+                return q.order("created_at").order("id")
+
+            # a page of plans can have more notes than a response holds
+            for n in self._fetch_all(notes_query):
+                notes.setdefault((n["care_plan_id"], n["caregiver_id"]), []).append(
+                    CaregiverNote.deserialize_from_db(n)
+                )
+
+        caregivers: dict[str, list[Caregiver]] = {}
+        for cg in cgs:
+            caregivers.setdefault(cg["care_plan_id"], []).append(
+                Caregiver.deserialize_from_db(
+                    cg, notes.get((cg["care_plan_id"], cg["caregiver_id"]), [])
+                )
             )
-        return [Caregiver.deserialize_from_db(cg) for cg in cgs]
+        return caregivers
 
     def get_care_plans(
         self,
@@ -373,6 +747,7 @@ class DBClient:
         guardian_id: str | None = None,
         dt: date | None = None,
         patient_name: str | None = None,
+        with_notes: bool = True,
     ) -> list[CarePlan]:
         st = self.client.table("care_plan").select("*")
         if care_plan_id:
@@ -384,11 +759,277 @@ class DBClient:
         if patient_name:
             st = st.eq("patient_name", patient_name.lower().strip())
         cps = st.execute().data
+        caregivers = self.get_caregivers_for_care_plans(
+            [cp["id"] for cp in cps], with_notes=with_notes
+        )
+        hot = [
+            CarePlan.deserialize_from_db(cp, caregivers.get(cp["id"], []))
+            for cp in cps
+        ]
+        if (care_plan_id and hot) or (dt and dt >= archive_cutoff()):
+            return hot
+        return hot + self.get_archived_care_plans(
+            care_plan_id, guardian_id, dt, patient_name, with_notes
+        )
+
+    def get_archived_care_plans(
+        self,
+        care_plan_id: str | None = None,
+        guardian_id: str | None = None,
+        dt: date | None = None,
+        patient_name: str | None = None,
+        with_notes: bool = True,
+    ) -> list[CarePlan]:
+        cols = ARCHIVE_COLUMNS + ", caregivers" + (", notes" if with_notes else "")
+        st = self.client.table("care_plan_archive").select(cols)
+        if care_plan_id:
+            st = st.eq("id", care_plan_id)
+        if guardian_id:
+            st = st.eq("guardian_id", guardian_id)
+        if dt:
+            st = st.eq("date", dt.isoformat())
+        if patient_name:
+            st = st.eq("patient_name", patient_name.lower().strip())
+        return [deserialize_archived_care_plan(cp) for cp in st.execute().data]
+
+    def iter_care_plans(
+        self,
+        guardian_id: str | None = None,
+        start: date | None = None,
+        end: date | None = None,
+        page_size: int = 100,
+        with_notes: bool = True,
+    ) -> Iterator[list[CarePlan]]:
+        # archived plans are the older ones, read them first to keep date order
+        if not start or start < archive_cutoff():
+            yield from self._iter_care_plans(
+                "care_plan_archive", guardian_id, start, end, page_size, with_notes
+            )
+        yield from self._iter_care_plans(
+            "care_plan", guardian_id, start, end, page_size, with_notes
+        )
+
+    def _iter_care_plans(
+        self,
+        table: str,
+        guardian_id: str | None,
+        start: date | None,
+        end: date | None,
+        page_size: int,
+        with_notes: bool,
+    ) -> Iterator[list[CarePlan]]:
+        offset = 0
+        while True:
+            q = self.client.table(table).select("*")
+            if guardian_id:
+                q = q.eq("guardian_id", guardian_id)
+            if start:
+                q = q.gte("date", start.isoformat())
+            if end:
+                q = q.lte("date", end.isoformat())
+            cps = (
+                q.order("date")
+                .order("id")
+                .range(offset, offset + page_size - 1)
+                .execute()
+                .data
+            )
+            if not cps:
+                return
+            if table == "care_plan_archive":
+                yield [deserialize_archived_care_plan(cp) for cp in cps]
+            else:
+                caregivers = self.get_caregivers_for_care_plans(
+                    [cp["id"] for cp in cps], with_notes=with_notes
+                )
+                yield [
+                    CarePlan.deserialize_from_db(cp, caregivers.get(cp["id"], []))
+                    for cp in cps
+                ]
+            # postgrest's max-rows can cut a page short, only an empty page
+            # is the end
+            offset += len(cps)
+
+    def _fetch_all(self, query, page_size: int = 1000) -> list[dict]:
+        # postgrest caps the rows of a single response at its max-rows, which
+        # may be below page_size, so only an empty page is the end
+        rows = []
+        while True:
+            page = (
+                query().range(len(rows), len(rows) + page_size - 1).execute().data
+            )
+            if not page:
+                return rows
+            rows.extend(page)
+
+    def get_daily_metrics(self, guardian_id: str, start: date, end: date) -> list[dict]:
+        return self._fetch_all(
+            lambda: self.client.table("care_plan_daily_metrics")
+            .select("*")
+            .eq("guardian_id", guardian_id)
+            .gte("date", start.isoformat())
+            .lte("date", end.isoformat())
+            .order("date")
+            .order("care_plan_id")
+        )
+
+    def get_guardian_caregiver_assignments(
+        self, guardian_id: str, start: date, end: date
+    ) -> list[dict]:
+        rows = self._fetch_all(
+            lambda: self.client.table("caregiver_notes")
+            .select("care_plan_id, caregiver_id, name, care_plan!inner(guardian_id)")
+            .eq("care_plan.guardian_id", guardian_id)
+            .gte("care_plan.date", start.isoformat())
+            .lte("care_plan.date", end.isoformat())
+            .order("care_plan_id")
+            .order("caregiver_id")
+        )
+        if start < archive_cutoff():
+            for cp in self._fetch_all(
+                lambda: self.client.table("care_plan_archive")
+                .select("id, caregivers")
+                .eq("guardian_id", guardian_id)
+                .gte("date", start.isoformat())
+                .lte("date", end.isoformat())
+                .order("id")
+            ):
+                rows.extend(
+                    {"care_plan_id": cp["id"], **cg} for cg in cp["caregivers"]
+                )
+        return rows
+
+    def search_care_plans(
+        self, guardian_id: str, query: str, limit: int = 50
+    ) -> list[dict]:
+        hits = (
+            self.client.rpc(
+                "search_care_plans",
+                {"p_guardian_id": guardian_id, "p_query": query, "p_limit": limit},
+            )
+            .execute()
+            .data
+        )
+        for h in hits:
+            h["date"] = date.fromisoformat(h["date"])
+        return hits
+
+    def get_care_plan_summaries(self, guardian_id: str) -> list[dict]:
+        data = self._fetch_all(
+            lambda: self.client.table("care_plan_summary")
+            .select("*")
+            .eq("guardian_id", guardian_id)
+            .order("date", desc=True)
+            .order("care_plan_id")
+        )
+        for cp in data:
+            cp["id"] = cp["care_plan_id"]
+            cp["date"] = date.fromisoformat(cp["date"])
+        return data
+
+    def get_care_plan_tasks(
+        self,
+        start: date,
+        end: date,
+        guardian_id: str | None = None,
+        caregiver_id: str | None = None,
+    ) -> list[dict]:
+        if caregiver_id:
+            data = (
+                self.client.table("caregiver_notes")
+                .select("care_plan!inner(id, date, patient_name, tasks)")
+                .eq("caregiver_id", caregiver_id)
+                .gte("care_plan.date", start.isoformat())
+                .lte("care_plan.date", end.isoformat())
+                .execute()
+                .data
+            )
+            rows = [d["care_plan"] for d in data]
+        else:
+            rows = (
+                self.client.table("care_plan")
+                .select("id, date, patient_name, tasks")
+                .eq("guardian_id", guardian_id)
+                .gte("date", start.isoformat())
+                .lte("date", end.isoformat())
+                .execute()
+                .data
+            )
+        if start < archive_cutoff():
+            q = (
+                self.client.table("care_plan_archive")
+                .select("id, date, patient_name, tasks")
+                .gte("date", start.isoformat())
+                .lte("date", end.isoformat())
+            )
+            if caregiver_id:
+                q = q.contains("caregivers", [{"caregiver_id": caregiver_id}])
+            else:
+                q = q.eq("guardian_id", guardian_id)
+            rows.extend(q.execute().data)
+        return rows
+
+    def get_caregiver_care_plan_keys(self, caregiver_id: str) -> list[dict]:
+        data = (
+            self.client.table("caregiver_notes")
+            .select("care_plan!inner(id, date, patient_name)")
+            .eq("caregiver_id", caregiver_id)
+            .execute()
+            .data
+        )
+        keys = [d["care_plan"] for d in data]
+        keys.extend(
+            self.client.table("care_plan_archive")
+            .select("id, date, patient_name")
+            .contains("caregivers", [{"caregiver_id": caregiver_id}])
+            .execute()
+            .data
+        )
+        for cp in keys:
+            cp["date"] = date.fromisoformat(cp["date"])
+        return keys
+
+    def get_caregiver_care_plans(
+        self, caregiver_id: str, dt: date | None = None
+    ) -> list[CarePlan]:
+        q = (
+            self.client.table("caregiver_notes")
+            .select("care_plan!inner(*)")
+            .eq("caregiver_id", caregiver_id)
+        )
+        if dt:
+            q = q.eq("care_plan.date", dt.isoformat())
+        cps = [d["care_plan"] for d in q.execute().data]
+        caregivers = self.get_caregivers_for_care_plans([cp["id"] for cp in cps])
         return [
-            CarePlan.deserialize_from_db(cp, self.get_caregivers(cp["id"]))
+            CarePlan.deserialize_from_db(cp, caregivers.get(cp["id"], []))
             for cp in cps
         ]
 
-    def get_care_plan(self, care_plan_id: str) -> CarePlan | None:
-        cp = self.get_care_plans(care_plan_id=care_plan_id)
+    def get_caregiver_assignments(
+        self, caregiver_ids: list[str], dt: date
+    ) -> list[dict]:
+        if not caregiver_ids:
+            return []
+        return (
+            self.client.table("caregiver_notes")
+            .select("caregiver_id, care_plan!inner(id, date, patient_name, tasks)")
+            .in_("caregiver_id", caregiver_ids)
+            .eq("care_plan.date", dt.isoformat())
+            .execute()
+            .data
+        )
+
+    def get_care_plan(
+        self, care_plan_id: str, with_notes: bool = True
+    ) -> CarePlan | None:
+        if self.cache:
+            return self.cache.get(
+                f"care_plan:{care_plan_id}:{with_notes}",
+                lambda: self._get_care_plan(care_plan_id, with_notes),
+            )
+        return self._get_care_plan(care_plan_id, with_notes)
+
+    def _get_care_plan(self, care_plan_id: str, with_notes: bool) -> CarePlan | None:
+        cp = self.get_care_plans(care_plan_id=care_plan_id, with_notes=with_notes)
         return cp[0] if cp else None
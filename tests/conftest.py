@@ -0,0 +1,36 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+
+@pytest.fixture
+def db_client():
+    """DBClient on the project in SUPABASE_URL with its service role key in
+    SUPABASE_KEY, the tests using it are skipped without them."""
+    if not os.environ.get("SUPABASE_URL") or not os.environ.get("SUPABASE_KEY"):
+        pytest.skip("needs SUPABASE_URL and SUPABASE_KEY")
+    from store import DBClient
+
+    return DBClient(os.environ["SUPABASE_URL"], os.environ["SUPABASE_KEY"])
+
+
+@pytest.fixture
+def guardian_login():
+    """(email, password) of an existing guardian of the test project."""
+    email = os.environ.get("TEST_GUARDIAN_EMAIL")
+    password = os.environ.get("TEST_GUARDIAN_PASSWORD")
+    if not email or not password:
+        pytest.skip("needs TEST_GUARDIAN_EMAIL and TEST_GUARDIAN_PASSWORD")
+    return email, password
+
+
+@pytest.fixture
+def care_plan_id():
+    """A plan of the test project whose notes the tests may add to."""
+    care_plan_id = os.environ.get("TEST_CARE_PLAN_ID")
+    if not care_plan_id:
+        pytest.skip("needs TEST_CARE_PLAN_ID")
+    return care_plan_id
@@ -0,0 +1,87 @@
+import uuid
+from dataclasses import replace
+from datetime import date, datetime, timedelta
+
+from store import Caregiver, Caregiver_Status, CarePlan, CaregiverNote
+
+T0 = datetime(2026, 1, 5, 9).astimezone()
+
+
+def make_plan(notes: list[CaregiverNote]) -> CarePlan:
+    caregivers = [
+        Caregiver(
+            cg_id,
+            cg_id,
+            Caregiver_Status.ACCEPTED,
+            [replace(n) for n in notes if n.caregiver_id == cg_id],
+        )
+        for cg_id in ("alice", "bob")
+    ]
+    return CarePlan("cp", "guardian", date(2026, 1, 5), "pat", T0, caregivers)
+
+
+def refresh(cp: CarePlan, server: list[CaregiverNote]) -> CarePlan:
+    # refresh_care_plan in main.py, with get_caregiver_notes answered from server
+    fresh = make_plan([])
+    fresh.take_notes(cp)
+    fresh.add_fetched_notes(
+        [n for n in server if cp.notes_cursor is None or n.id > cp.notes_cursor]
+    )
+    return fresh
+
+
+def note(id: int, caregiver_id: str, mins: int) -> CaregiverNote:
+    return CaregiverNote(
+        f"note {id}", T0 + timedelta(minutes=mins), caregiver_id, None, id
+    )
+
+
+def test_other_caregivers_note_between_write_and_refresh():
+    server = [note(1, "alice", 0)]
+    cp = make_plan(server)
+    assert cp.notes_cursor == 1
+
+    # bob's note is inserted, then this session (alice) writes one
+    server.append(note(2, "bob", 1))
+    own = note(3, "alice", 2)
+    server.append(own)
+    cp.add_notes([own])
+    assert cp.notes_cursor == 1
+
+    cp = refresh(cp, server)
+    assert [n.id for n, _ in cp.caregiver_notes] == [1, 2, 3]
+    assert cp.notes_cursor == 3
+    assert [n.id for n in cp.caregivers[1].notes] == [2]
+
+    # nothing new, nothing added twice
+    cp = refresh(cp, server)
+    assert [n.id for n, _ in cp.caregiver_notes] == [1, 2, 3]
+
+
+def test_note_committed_behind_the_latest_created_at():
+    server = [note(1, "alice", 0), note(3, "alice", 5)]
+    cp = make_plan(server)
+    # a note whose transaction started earlier commits after note 3
+    server.append(note(4, "bob", 2))
+
+    cp = refresh(cp, server)
+    assert [n.id for n, _ in cp.caregiver_notes] == [1, 4, 3]
+    assert cp.notes_cursor == 4
+
+
+def test_get_caregiver_notes_after_own_write(db_client, care_plan_id):
+    before = db_client.get_caregiver_notes(care_plan_id)
+    cursor = before[-1].id if before else None
+    ids = []
+    try:
+        other = db_client.add_caregiver_note(
+            care_plan_id, str(uuid.uuid4()), "other caregiver"
+        )
+        own = db_client.add_caregiver_note(care_plan_id, str(uuid.uuid4()), "own")
+        ids = [other.id, own.id]
+        fetched = db_client.get_caregiver_notes(care_plan_id, since=cursor)
+        assert [n.id for n in fetched] == ids
+        assert db_client.get_caregiver_notes(care_plan_id, since=own.id) == []
+    finally:
+        if ids:
+            db_client.client.table("caregiver_note").delete().in_("id", ids).execute()
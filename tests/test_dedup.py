@@ -0,0 +1,31 @@
+from datetime import time
+
+from dedup import merge_questions, merge_tasks, minhash, normalize
+from store import Question, Task
+
+
+def test_one_token_text():
+    assert minhash(normalize("Bath?")) == minhash(normalize("baths"))
+    merged, dropped = merge_questions(
+        [Question("Did she eat breakfast?", "")], [Question("Bath?", "")]
+    )
+    assert [q.question for q in merged] == ["Did she eat breakfast?", "Bath?"]
+    assert dropped == 0
+
+
+def test_one_token_duplicate():
+    merged, dropped = merge_tasks(
+        [Task("Lunch", time(12))], [Task("lunch!", time(12, 15)), Task("Walk")]
+    )
+    assert [t.content for t in merged] == ["Lunch", "Walk"]
+    assert dropped == 1
+
+
+def test_stopword_only_text():
+    # all stopwords, so the words themselves are the tokens
+    assert normalize("Is it?") == frozenset({"is", "it"})
+    merged, dropped = merge_questions(
+        [Question("Is it?", "")], [Question("is it", ""), Question("", "")]
+    )
+    assert [q.question for q in merged] == ["Is it?", ""]
+    assert dropped == 1
@@ -0,0 +1,21 @@
+from store import DBClient
+
+ROWS = [{"id": i} for i in range(10)]
+MAX_ROWS = 3
+
+
+class FakeQuery:
+    """A PostgREST query on ROWS that, like max-rows, returns at most MAX_ROWS."""
+
+    def range(self, start: int, end: int):
+        self.data = ROWS[start : min(end + 1, start + MAX_ROWS)]
+        return self
+
+    def execute(self):
+        return self
+
+
+def test_pages_cut_short_by_max_rows():
+    # _fetch_all doesn't use the client, so skip making one
+    db = object.__new__(DBClient)
+    assert db._fetch_all(FakeQuery, page_size=5) == ROWS
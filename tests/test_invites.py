@@ -0,0 +1,24 @@
+import pytest
+
+pytest.importorskip("gotrue")
+import invites
+from invites import Invite, Invite_Status, MAX_ATTEMPTS, send_with_retry
+
+
+class NoLimit:
+    def acquire(self):
+        pass
+
+
+def test_no_backoff_after_last_attempt(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(invites.time, "sleep", sleeps.append)
+
+    def send(invite):
+        raise TimeoutError
+
+    invite = Invite("a@example.com", "A", "B")
+    send_with_retry(invite, send, NoLimit())
+    assert invite.status == Invite_Status.FAILED
+    assert invite.attempts == MAX_ATTEMPTS
+    assert len(sleeps) == MAX_ATTEMPTS - 1
@@ -0,0 +1,43 @@
+"""S3 listing and bulk transfers against moto, skipped where it isn't installed
+(pip install "moto[s3]")."""
+
+import pytest
+
+pytest.importorskip("moto")
+import boto3
+from moto import mock_aws
+
+import utils
+
+BUCKET = "relait-test"
+
+
+@pytest.fixture
+def s3_client(monkeypatch):
+    """A moto S3 client with an empty BUCKET, which s3_bucket() names."""
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    monkeypatch.setenv("S3_BUCKET", BUCKET)
+    utils.s3_bucket.cache_clear()
+    with mock_aws():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket=BUCKET)
+        yield client
+    utils.s3_bucket.cache_clear()
+
+
+def test_bulk_transfer_and_listing_past_one_page(s3_client):
+    # list_objects_v2 returns at most 1000 keys per call
+    objects = {f"audio/cp/{i:05}.wav": f"recording {i}".encode() for i in range(1100)}
+    uploaded = list(
+        utils.upload_s3_objects(objects.items(), s3_client, max_workers=4)
+    )
+    assert sorted(uploaded) == sorted(objects)
+
+    s3_client.put_object(Bucket=BUCKET, Key="other/x.wav", Body=b"")
+    keys = list(utils.get_s3_object_keys(s3_client, prefix="audio/"))
+    assert sorted(keys) == sorted(objects)
+
+    downloaded = dict(utils.download_s3_objects(keys, s3_client, max_workers=4))
+    assert downloaded == objects
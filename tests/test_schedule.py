@@ -0,0 +1,31 @@
+from datetime import date, time
+
+from schedule import CaregiverSchedule, TimeSlotIndex, task_slot
+from store import Task
+
+DAY = date(2026, 1, 5)
+
+
+def test_late_task_without_end_stops_at_midnight():
+    slot = task_slot("cp", "pat", DAY, 0, Task("bedtime", time(23, 45)))
+    assert (slot.start, slot.end) == (23 * 60 + 45, 24 * 60)
+    assert slot.end_time == time.max
+
+
+def test_end_before_start_gets_default_length():
+    slot = task_slot("cp", "pat", DAY, 0, Task("walk", time(10), time(9)))
+    assert (slot.start, slot.end) == (600, 630)
+
+
+def test_late_tasks_in_calendar_and_schedule():
+    tasks = [
+        Task("meds", time(23, 30)).serialize_to_db(),
+        Task("check", time(23, 45)).serialize_to_db(),
+    ]
+    cp = {"id": "cp", "date": DAY.isoformat(), "patient_name": "pat", "tasks": tasks}
+    idx = TimeSlotIndex.build([cp])
+    assert len(idx.calendar_events(DAY, DAY)) == 2
+    assert len(idx.overlapping) == 2
+    schedule = CaregiverSchedule([{"caregiver_id": "cg", "care_plan": cp}])
+    slot = task_slot("other", "pat2", DAY, 0, Task("call", time(23, 50)))
+    assert len(schedule.conflicts("cg", slot)) == 2
@@ -0,0 +1,69 @@
+def test_session_written_after_sign_in(db_client, guardian_login):
+    # the same calls as login_submit and persist_session in main.py
+    auth = db_client.sign_in(*guardian_login)
+    session = db_client.create_user_session(
+        auth.user.id,
+        auth.session.access_token,
+        auth.session.refresh_token,
+        int(auth.session.expires_at),
+    )
+    try:
+        stored = db_client.get_user_session(session["id"])
+        assert stored is not None
+        assert stored["user_id"] == auth.user.id
+        assert stored["refresh_token"] == auth.session.refresh_token
+    finally:
+        db_client.delete_user_session(session["id"])
+    assert db_client.get_user_session(session["id"]) is None
+
+
+def test_refreshed_token_stored(db_client, guardian_login):
+    # the same calls as refresh_auth_session in main.py
+    auth = db_client.sign_in(*guardian_login)
+    session = db_client.create_user_session(
+        auth.user.id,
+        auth.session.access_token,
+        auth.session.refresh_token,
+        int(auth.session.expires_at),
+    )
+    try:
+        refreshed = db_client.refresh_session(auth.session.refresh_token).session
+        db_client.update_user_session(
+            session["id"],
+            refreshed.access_token,
+            refreshed.refresh_token,
+            int(refreshed.expires_at),
+        )
+        stored = db_client.get_user_session(session["id"])
+        assert stored["refresh_token"] == refreshed.refresh_token
+        assert stored["refresh_token"] != auth.session.refresh_token
+    finally:
+        db_client.delete_user_session(session["id"])
+
+
+def test_lapsed_sessions_cleared_on_sign_in(db_client, guardian_login):
+    auth = db_client.sign_in(*guardian_login)
+    args = (
+        auth.user.id,
+        auth.session.access_token,
+        auth.session.refresh_token,
+        int(auth.session.expires_at),
+    )
+    lapsed = db_client.create_user_session(*args)
+    db_client.service_client.table("user_session").update(
+        {"session_expires_at": "2000-01-01T00:00:00+00:00"}
+    ).eq("id", lapsed["id"]).execute()
+    assert db_client.get_user_session(lapsed["id"]) is None
+
+    session = db_client.create_user_session(*args)
+    try:
+        rows = (
+            db_client.service_client.table("user_session")
+            .select("id")
+            .eq("id", lapsed["id"])
+            .execute()
+            .data
+        )
+        assert rows == []
+    finally:
+        db_client.delete_user_session(session["id"])
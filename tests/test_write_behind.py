@@ -0,0 +1,56 @@
+from datetime import date, datetime
+
+from store import CarePlan, Task
+from write_behind import WriteBehind
+
+
+class FakeDB:
+    """write_care_plan against one stored plan, with sql/010's version bump."""
+
+    def __init__(self):
+        self.version = 0
+        self.tasks = []
+
+    def write_care_plan(self, care_plan_id: str, update: dict, version: int) -> bool:
+        if version != self.version:
+            return False
+        self.tasks = update["tasks"]
+        self.version += 1
+        return True
+
+
+def plan(version: int, *tasks: str) -> CarePlan:
+    return CarePlan(
+        "cp",
+        "guardian",
+        date(2026, 1, 5),
+        "pat",
+        datetime(2026, 1, 5),
+        tasks=[Task(t) for t in tasks],
+        version=version,
+    )
+
+
+def test_stale_copy_does_not_overwrite():
+    db = FakeDB()
+    wb = WriteBehind(db, delay=60)
+    stale = plan(0, "walk")
+    guardian = plan(0, "walk")
+
+    guardian.tasks.append(Task("lunch"))
+    wb.schedule(guardian, tasks=True)
+    wb.flush()
+    assert guardian.version == 1
+
+    stale.tasks[0].status = True
+    wb.schedule(stale, tasks=True)
+    wb.flush()
+    assert [t["content"] for t in db.tasks] == ["walk", "lunch"]
+    assert len(wb.pop_errors()) == 1
+
+    # consecutive writes from the same copy follow its version
+    guardian.tasks[0].status = True
+    wb.schedule(guardian, tasks=True)
+    wb.flush()
+    assert db.tasks[0]["status"] and db.version == 2
+    assert not wb.pop_errors()
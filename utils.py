@@ -1,5 +1,24 @@
 from datetime import time, datetime
+from functools import cache
+from typing import Iterable, Iterator
+from concurrent.futures import (
+    Executor,
+    Future,
+    ThreadPoolExecutor,
+    FIRST_COMPLETED,
+    as_completed,
+    wait,
+)
+from io import BytesIO
+import logging
 import os
+import uuid
+
+S3_MAX_CONCURRENCY = 10
+AUDIO_PREFIX = "audio"
+MULTIPART_THRESHOLD = 8 * 1024 * 1024
+
+logger = logging.getLogger(__name__)
 
 
 def add_time(t1: time, hour: int, min: int) -> time:
@@ -24,9 +43,117 @@ def num_secs(timestamp: str) -> int:
     return int(fields[0]) * 3600 + int(fields[1]) * 60
 
 
-def get_s3_object_keys(s3_client, prefix: str) -> list[str]:
-    s3_bucket = os.getenv("S3_BUCKET")
-    contents = s3_client.list_objects(Bucket=s3_bucket, Prefix=prefix).get(
-        "Contents", []
+def minutes_of_day(t: time) -> int:
+    return t.hour * 60 + t.minute
+
+
+@cache
+def s3_bucket() -> str:
+    return os.getenv("S3_BUCKET")
+
+
+@cache
+def get_s3_client():
+    # one client per process: boto3 clients are thread safe and keep a pool
+    # of connections, sized here for the bulk transfers below. boto3 is only
+    # imported here since most importers of utils never touch S3.
+    import boto3
+    from botocore.config import Config
+
+    return boto3.client(
+        "s3",
+        endpoint_url=os.getenv("S3_ENDPOINT_URL"),
+        config=Config(max_pool_connections=S3_MAX_CONCURRENCY),
+    )
+
+
+def get_s3_object_keys(s3_client=None, prefix: str = "") -> Iterator[str]:
+    paginator = (s3_client or get_s3_client()).get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=s3_bucket(), Prefix=prefix):
+        for c in page.get("Contents", []):
+            yield c["Key"]
+
+
+def download_s3_objects(
+    keys: Iterable[str], s3_client=None, max_workers: int = S3_MAX_CONCURRENCY
+) -> Iterator[tuple[str, bytes]]:
+    client = s3_client or get_s3_client()
+
+    def download(key: str) -> tuple[str, bytes]:
+        return key, client.get_object(Bucket=s3_bucket(), Key=key)["Body"].read()
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        yield from bounded_map(executor, download, keys, max_workers)
+
+
+def upload_s3_objects(
+    objects: Iterable[tuple[str, bytes]],
+    s3_client=None,
+    max_workers: int = S3_MAX_CONCURRENCY,
+) -> Iterator[str]:
+    client = s3_client or get_s3_client()
+
+    def upload(obj: tuple[str, bytes]) -> str:
+        client.put_object(Bucket=s3_bucket(), Key=obj[0], Body=obj[1])
+        return obj[0]
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        yield from bounded_map(executor, upload, objects, max_workers)
+
+
+def bounded_map(executor: Executor, fn, items: Iterable, max_pending: int) -> Iterator:
+    # unlike executor.map this does not drain the whole input up front, so
+    # at most max_pending items are in memory at a time
+    pending = set()
+    for item in items:
+        if len(pending) >= max_pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for f in done:
+                yield f.result()
+        pending.add(executor.submit(fn, item))
+    for f in as_completed(pending):
+        yield f.result()
+
+
+@cache
+def archive_executor() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(
+        max_workers=S3_MAX_CONCURRENCY, thread_name_prefix="audio-archive"
+    )
+
+
+def audio_keys(care_plan_id: str) -> Iterator[str]:
+    return get_s3_object_keys(prefix=f"{AUDIO_PREFIX}/{care_plan_id}/")
+
+
+def archive_audio(care_plan_id: str, audio: bytes) -> Future[str]:
+    """Upload a recording in the background. The future holds its object key,
+    take it with archived_key once the upload is done."""
+    key = f"{AUDIO_PREFIX}/{care_plan_id}/{uuid.uuid4().hex}.wav"
+    return archive_executor().submit(upload_audio, key, audio)
+
+
+def archived_key(upload: Future[str]) -> str | None:
+    """The object key of a finished archive_audio upload, None if it failed,
+    so that nothing points at a recording that was never stored."""
+    try:
+        return upload.result(timeout=0)
+    except Exception:
+        logger.exception("audio archive upload failed")
+        return None
+
+
+def upload_audio(key: str, audio: bytes) -> str:
+    from boto3.s3.transfer import TransferConfig
+
+    # upload_fileobj switches to a multipart upload above the threshold
+    get_s3_client().upload_fileobj(
+        BytesIO(audio),
+        s3_bucket(),
+        key,
+        ExtraArgs={"ContentType": "audio/wav"},
+        Config=TransferConfig(
+            multipart_threshold=MULTIPART_THRESHOLD, use_threads=False
+        ),
     )
-    return [c["Key"] for c in contents]
+    return key
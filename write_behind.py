@@ -0,0 +1,94 @@
+import threading
+from store import DBClient, CarePlan, Task, Question
+
+WRITE_DELAY_SECS = 1.0
+
+
+class WriteBehind:
+    """Coalesces care plan edits and writes them from a background timer.
+
+    Callers apply edits to their CarePlan right away and schedule() it. The
+    plan's tasks and questions are snapshotted at that point; further edits
+    within the delay replace the snapshot, so a burst of edits is written
+    once. Writes only go through if the plan is still at the version the
+    caller's copy was loaded at, so a copy that went stale (a cached plan,
+    or one loaded before someone else's edit) can't overwrite newer edits.
+    Failed and rejected writes are kept in errors for the UI to report.
+    """
+
+    def __init__(self, db_client: DBClient, delay: float = WRITE_DELAY_SECS):
+        self.db_client = db_client
+        self.delay = delay
+        self.errors: list[str] = []
+        self._pending: dict[str, dict] = {}
+        # the copy each pending update was taken from, its version is checked
+        # on write and moved on after it
+        self._plans: dict[str, CarePlan] = {}
+        self._timers: dict[str, threading.Timer] = {}
+        self._writing: set[str] = set()
+        self._lock = threading.Lock()
+        # held while writing so flushes of the same plan never interleave
+        self._write_lock = threading.Lock()
+
+    def schedule(self, cp: CarePlan, tasks: bool = False, questions: bool = False):
+        update = {}
+        if tasks:
+            update["tasks"] = [Task.serialize_to_db(t) for t in cp.tasks]
+        if questions:
+            update["questions"] = [Question.serialize_to_db(q) for q in cp.questions]
+        if not update:
+            return
+        with self._lock:
+            self._pending.setdefault(cp.id, {}).update(update)
+            self._plans[cp.id] = cp
+            if cp.id not in self._timers:
+                timer = threading.Timer(self.delay, self.flush, args=[cp.id])
+                timer.daemon = True
+                self._timers[cp.id] = timer
+                timer.start()
+
+    def is_dirty(self, care_plan_id: str) -> bool:
+        with self._lock:
+            return care_plan_id in self._pending or care_plan_id in self._writing
+
+    def discard(self, care_plan_id: str):
+        with self._lock:
+            self._pending.pop(care_plan_id, None)
+            self._plans.pop(care_plan_id, None)
+            timer = self._timers.pop(care_plan_id, None)
+        if timer:
+            timer.cancel()
+
+    def flush(self, care_plan_id: str | None = None):
+        """Write pending edits now, of one plan or of all of them."""
+        with self._lock:
+            ids = [care_plan_id] if care_plan_id else list(self._pending)
+        for id in ids:
+            with self._write_lock:
+                with self._lock:
+                    update = self._pending.pop(id, None)
+                    cp = self._plans.pop(id, None)
+                    timer = self._timers.pop(id, None)
+                    if update:
+                        self._writing.add(id)
+                if timer:
+                    timer.cancel()
+                if not update:
+                    continue
+                try:
+                    if self.db_client.write_care_plan(id, update, cp.version):
+                        cp.version += 1
+                    else:
+                        self.errors.append(
+                            "The care plan was changed elsewhere since it was "
+                            "loaded, your last edits were not saved"
+                        )
+                except Exception as e:
+                    self.errors.append(f"Saving the care plan failed: {e}")
+                finally:
+                    with self._lock:
+                        self._writing.discard(id)
+
+    def pop_errors(self) -> list[str]:
+        errors, self.errors = self.errors, []
+        return errors